@@ -0,0 +1,172 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from elasticsearch import Elasticsearch
+
+import serving
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Размыкается после failure_threshold ошибок подряд; замыкает его фоновая проверка"""
+
+    def __init__(self, failure_threshold: int = 3):
+        self.failure_threshold = failure_threshold
+        self.failures = 0
+        self.is_open = False
+        self.opened_count = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        return not self.is_open
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self) -> bool:
+        """Учесть ошибку; True, если цепь только что разомкнулась"""
+        with self._lock:
+            self.failures += 1
+            if not self.is_open and self.failures >= self.failure_threshold:
+                self.is_open = True
+                self.opened_count += 1
+                return True
+            return False
+
+    def close(self):
+        with self._lock:
+            self.failures = 0
+            self.is_open = False
+
+
+class ElasticsearchClient:
+    """Клиент Elasticsearch с пулом соединений, таймаутами и circuit breaker.
+
+    Состояние здоровья обновляется фоновым потоком, поэтому /health
+    и поиск при разомкнутой цепи не обращаются к сети. Проверка - не только
+    ping, но и пустой поиск по probe_index с тем же таймаутом, что и у поиска:
+    кластер, который отвечает на ping, но не успевает искать, цепь не замыкает.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 9200, connections_per_node: int = 10,
+                 request_timeout: float = 0.3, failure_threshold: int = 3, probe_interval: float = 5.0,
+                 probe_index: str = "products"):
+        self.request_timeout = request_timeout
+        self.probe_index = probe_index
+        self.probe_interval = probe_interval
+        self.es = Elasticsearch(
+            [{'host': host, 'port': port, 'scheme': 'http'}],
+            connections_per_node=connections_per_node,
+            request_timeout=request_timeout,
+            max_retries=0,
+            retry_on_timeout=False
+        )
+        self.breaker = CircuitBreaker(failure_threshold)
+        self.status = "unknown"
+        self.last_check: Optional[datetime] = None
+        self.last_latency: Optional[float] = None
+        self._on_recovery: Optional[Callable[[], None]] = None
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls) -> "ElasticsearchClient":
+        return cls(
+            host=serving.ES_HOST,
+            port=serving.ES_PORT,
+            connections_per_node=serving.ES_CONNECTIONS_PER_NODE,
+            request_timeout=serving.ES_REQUEST_TIMEOUT_MS / 1000.0,
+            failure_threshold=serving.ES_BREAKER_FAILURES,
+            probe_interval=serving.ES_PROBE_INTERVAL_S
+        )
+
+    @property
+    def available(self) -> bool:
+        """Можно ли сейчас обращаться к Elasticsearch (без сетевого запроса)"""
+        return self.status == "ok" and self.breaker.allow()
+
+    def probe(self) -> bool:
+        """Проверка доступности поиском; замыкает цепь при восстановлении. True - поиск работает"""
+        start = time.monotonic()
+        try:
+            reachable = bool(self.es.ping())
+        except Exception:
+            reachable = False
+        searchable = reachable and self._probe_search()
+
+        self.last_latency = time.monotonic() - start
+        self.last_check = datetime.now()
+        recovered = searchable and (self.status != "ok" or self.breaker.is_open)
+
+        if searchable:
+            self.breaker.close()
+            self.status = "ok"
+        elif reachable:
+            # Кластер отвечает, но поиск не укладывается в таймаут - цепь остается как есть
+            self.status = "circuit_open" if self.breaker.is_open else "slow"
+        else:
+            self.status = "unavailable"
+
+        if recovered:
+            logger.info("Elasticsearch доступен")
+            if self._on_recovery:
+                self._on_recovery()
+        return searchable
+
+    def _probe_search(self) -> bool:
+        """Пустой поиск (size: 0) с таймаутом поиска; отсутствующий индекс - не ошибка"""
+        try:
+            self.es.options(request_timeout=self.request_timeout, ignore_status=404).search(
+                index=self.probe_index, body={"size": 0}
+            )
+            return True
+        except Exception:
+            return False
+
+    def start_prober(self, on_recovery: Optional[Callable[[], None]] = None):
+        """Запуск фоновой проверки доступности"""
+        self._on_recovery = on_recovery
+        self._prober = threading.Thread(target=self._probe_loop, name="es-prober", daemon=True)
+        self._prober.start()
+
+    def stop_prober(self):
+        self._stop.set()
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            was_ok = self.status == "ok"
+            if not self.probe() and was_ok:
+                logger.warning("Elasticsearch недоступен, лексический этап отключен до восстановления")
+
+    def search(self, index: str, body: Dict) -> Optional[Dict]:
+        """Поиск с таймаутом; None, если цепь разомкнута или запрос не удался"""
+        if not self.available:
+            return None
+
+        try:
+            response = self.es.options(request_timeout=self.request_timeout).search(index=index, body=body)
+        except Exception as e:
+            if self.breaker.record_failure():
+                self.status = "circuit_open"
+                logger.error(f"Elasticsearch: цепь разомкнута после {self.breaker.failures} ошибок ({e})")
+            else:
+                logger.warning(f"Ошибка поиска в Elasticsearch: {e}")
+            return None
+
+        self.breaker.record_success()
+        return response
+
+    def health(self) -> Dict:
+        """Закэшированное состояние для /health и /stats"""
+        return {
+            "status": self.status,
+            "circuit_open": self.breaker.is_open,
+            "circuit_opened_count": self.breaker.opened_count,
+            "last_check": self.last_check.isoformat() if self.last_check else None,
+            "last_latency_ms": round(self.last_latency * 1000, 3) if self.last_latency is not None else None
+        }
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Офлайн-оценка качества и задержки поиска по эталонному набору запросов.
+
+Движок запускается в процессе (без HTTP), запросы выполняются параллельно.
+Отчет - JSON с отсортированными ключами, который можно сравнивать между
+запусками (--compare) и хранить рядом с изменением, влияющим на скорость.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Кэш результатов и деградация исказили бы и задержку, и качество
+os.environ.setdefault("SEARCH_RESULT_CACHE_SIZE", "0")
+os.environ.setdefault("SEARCH_EMBEDDING_CACHE_SIZE", "0")
+os.environ.setdefault("SEARCH_OVERLOAD_POLICY", "reject")
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "golden_queries.json")
+K_VALUES = (1, 3, 5)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(p * len(values)))], 3)
+
+
+async def run_queries(engine, queries: List[Dict], threshold: float, limit: int,
+                      concurrency: int, repeat: int) -> List[Dict]:
+    """Выполнить запросы с ограничением параллельности; строка отчета на запрос"""
+    from inference import InferenceOverloaded
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(item: Dict) -> Dict:
+        async with semaphore:
+            latencies = []
+            records = []
+            error = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                try:
+                    records = await engine.collect_results(item["query"], threshold, limit)
+                except InferenceOverloaded as e:
+                    error = str(e)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        found = [
+            (engine.category_mapping[engine.flat_categories[r.category_id]]["subcategory_name"], r.method)
+            for r in records
+        ]
+        expected = [name.lower() for name in item["expected"]]
+        rank = next((i + 1 for i, (name, _) in enumerate(found) if name.lower() in expected), None)
+
+        return {
+            "query": item["query"],
+            "kind": item.get("kind", "other"),
+            "expected": item["expected"],
+            "top": [name for name, _ in found],
+            "rank": rank,
+            "hit_method": found[rank - 1][1] if rank else None,
+            "top1_method": found[0][1] if found else None,
+            # Все замеры: перцентили считаются по ним, а не по лучшему повтору
+            "latencies_ms": [round(latency, 3) for latency in latencies],
+            "error": error
+        }
+
+    return await asyncio.gather(*(run_one(item) for item in queries))
+
+
+def summarize(rows: List[Dict]) -> Dict:
+    """Recall@k, MRR, доля чистых негативных запросов и перцентили задержки"""
+    positives = [row for row in rows if row["expected"]]
+    negatives = [row for row in rows if not row["expected"]]
+    latencies = [latency for row in rows for latency in row["latencies_ms"]]
+
+    summary = {
+        "count": len(rows),
+        "samples": len(latencies),
+        "errors": sum(1 for row in rows if row["error"]),
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0
+        }
+    }
+    if positives:
+        for k in K_VALUES:
+            hits = sum(1 for row in positives if row["rank"] and row["rank"] <= k)
+            summary[f"recall@{k}"] = round(hits / len(positives), 4)
+        summary["mrr"] = round(sum(1 / row["rank"] for row in positives if row["rank"]) / len(positives), 4)
+    if negatives:
+        summary["negative_clean_rate"] = round(sum(1 for row in negatives if not row["top"]) / len(negatives), 4)
+    return summary
+
+
+def lexical_leaks(engine, queries: List[Dict]) -> List[str]:
+    """Запросы (кроме exact), на которые отвечает точный этап по названиям и синонимам каталога"""
+    from matching import match_exact_and_synonyms
+
+    return [
+        item["query"] for item in queries
+        if item.get("kind") not in ("exact", "negative")
+        and match_exact_and_synonyms(item["query"], engine.lexical_entries)
+    ]
+
+
+def build_report(golden: Dict, rows: List[Dict], args, leaks: List[str]) -> Dict:
+    by_kind = defaultdict(list)
+    for row in rows:
+        by_kind[row["kind"]].append(row)
+
+    return {
+        "golden_version": golden.get("version"),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "threshold": args.threshold,
+            "limit": args.limit,
+            "concurrency": args.concurrency,
+            "repeat": args.repeat,
+            "env": {key: value for key, value in sorted(os.environ.items()) if key.startswith("SEARCH_")}
+        },
+        "metrics": summarize(rows),
+        "lexical_leaks": leaks,
+        "by_kind": {kind: summarize(kind_rows) for kind, kind_rows in sorted(by_kind.items())},
+        "attribution": {
+            # Каким методом найден правильный ответ и каким - первый результат
+            "hit_method": dict(Counter(row["hit_method"] for row in rows if row["hit_method"])),
+            "top1_method": dict(Counter(row["top1_method"] for row in rows if row["top1_method"]))
+        },
+        "queries": sorted(rows, key=lambda row: (row["kind"], row["query"]))
+    }
+
+
+def compare(report: Dict, baseline: Dict):
+    """Печать разницы метрик и запросов, у которых изменился ранг"""
+    print(f"\n📊 Сравнение с базовым запуском ({baseline.get('created')}):")
+    if report["golden_version"] != baseline.get("golden_version"):
+        print(f"   ⚠️  Разные версии эталона: {baseline.get('golden_version')} → {report['golden_version']}")
+
+    def flatten(metrics: Dict, prefix: str = "") -> Dict[str, float]:
+        flat = {}
+        for key, value in metrics.items():
+            if isinstance(value, dict):
+                flat.update(flatten(value, f"{prefix}{key}."))
+            else:
+                flat[f"{prefix}{key}"] = value
+        return flat
+
+    current, previous = flatten(report["metrics"]), flatten(baseline["metrics"])
+    for key in sorted(current):
+        if key in previous and current[key] != previous[key]:
+            print(f"   {key}: {previous[key]} → {current[key]} ({current[key] - previous[key]:+.4f})")
+
+    previous_ranks = {row["query"]: row["rank"] for row in baseline.get("queries", [])}
+    for row in report["queries"]:
+        if row["query"] in previous_ranks and previous_ranks[row["query"]] != row["rank"]:
+            print(f"   '{row['query']}': ранг {previous_ranks[row['query']]} → {row['rank']}")
+
+
+def print_summary(report: Dict):
+    metrics = report["metrics"]
+    print(f"\n🎯 Эталон v{report['golden_version']}: {metrics['count']} запросов, ошибок: {metrics['errors']}")
+    for key in [f"recall@{k}" for k in K_VALUES] + ["mrr", "negative_clean_rate"]:
+        if key in metrics:
+            print(f"   {key}: {metrics[key]:.4f}")
+    latency = metrics["latency_ms"]
+    print(f"   Задержка: p50={latency['p50']}мс p95={latency['p95']}мс p99={latency['p99']}мс")
+    print(f"   Найдено методом: {report['attribution']['hit_method']}")
+    for kind, kind_metrics in report["by_kind"].items():
+        print(f"   [{kind}] recall@1={kind_metrics.get('recall@1', '-')} mrr={kind_metrics.get('mrr', '-')} "
+              f"p95={kind_metrics['latency_ms']['p95']}мс")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Офлайн-оценка поиска по эталонным запросам")
+    parser.add_argument("--golden", default=GOLDEN_PATH, help="Файл эталонных запросов")
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="Повторов на запрос (все замеры идут в перцентили)")
+    parser.add_argument("--output", help="Файл отчета (по умолчанию eval_runs/<время>.json)")
+    parser.add_argument("--compare", help="Отчет предыдущего запуска для сравнения")
+    args = parser.parse_args(argv)
+
+    with open(args.golden, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+
+    # Импорт main создает движок с текущими переменными окружения SEARCH_*
+    from main import search_engine as engine
+
+    leaks = lexical_leaks(engine, golden["queries"])
+    if leaks:
+        print(f"⚠️  На эти запросы отвечает точный этап (они есть в каталоге): {', '.join(leaks)}")
+
+    rows = asyncio.run(run_queries(engine, golden["queries"], args.threshold, args.limit,
+                                   args.concurrency, args.repeat))
+    report = build_report(golden, rows, args, leaks)
+    print_summary(report)
+
+    output = args.output or os.path.join("eval_runs", datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"\n💾 Отчет сохранен: {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
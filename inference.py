@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+import serving
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceOverloaded(Exception):
+    """Пул инференса переполнен или истек дедлайн запроса"""
+
+
+class _DeadlineExpired(Exception):
+    pass
+
+
+class InferencePool:
+    """Ограниченный пул потоков для вызовов модели с контролем допуска.
+
+    Одновременно принимается не больше size + max_queue задач; остальные
+    отклоняются сразу. Задача, простоявшая в очереди дольше дедлайна,
+    не выполняется.
+    """
+
+    def __init__(self, size: int = 2, max_queue: int = 32, deadline: float = 2.0):
+        self.size = size
+        self.max_queue = max_queue
+        self.capacity = size + max_queue
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="inference")
+
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.degraded = 0
+        self.wait_times = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls) -> "InferencePool":
+        return cls(
+            size=serving.INFERENCE_POOL_SIZE,
+            max_queue=serving.INFERENCE_QUEUE_SIZE,
+            deadline=serving.INFERENCE_DEADLINE_MS / 1000.0
+        )
+
+    async def run(self, fn: Callable, *args, deadline: Optional[float] = None):
+        """Выполнить fn(*args) в пуле; InferenceOverloaded при перегрузке или дедлайне.
+
+        Дедлайн запроса может только сократить серверный, но не продлить его.
+        """
+        deadline = min(deadline, self.deadline) if deadline else self.deadline
+
+        with self._lock:
+            if self.pending >= self.capacity:
+                self.rejected += 1
+                raise InferenceOverloaded("Очередь инференса переполнена")
+            self.pending += 1
+
+        enqueued = time.monotonic()
+
+        def task():
+            waited = time.monotonic() - enqueued
+            self.wait_times.append(waited)
+            if waited >= deadline:
+                raise _DeadlineExpired()
+            return fn(*args)
+
+        future = asyncio.get_running_loop().run_in_executor(self.executor, task)
+        # Слот освобождается только когда поток действительно завершил задачу
+        future.add_done_callback(self._release)
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout=deadline)
+        except (asyncio.TimeoutError, _DeadlineExpired):
+            with self._lock:
+                self.expired += 1
+            raise InferenceOverloaded("Истек дедлайн инференса")
+
+        with self._lock:
+            self.completed += 1
+        return result
+
+    def record_degraded(self):
+        with self._lock:
+            self.degraded += 1
+
+    def stats(self) -> Dict:
+        """Метрики пула: очередь, отказы и время ожидания"""
+        waits = sorted(self.wait_times)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 3)
+
+        with self._lock:
+            return {
+                "pool_size": self.size,
+                "max_queue": self.max_queue,
+                "in_flight": self.pending,
+                "queue_depth": max(0, self.pending - self.size),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "deadline_expired": self.expired,
+                "degraded": self.degraded,
+                "queue_wait_ms_p50": percentile(0.5),
+                "queue_wait_ms_p95": percentile(0.95),
+                "queue_wait_ms_max": percentile(1.0)
+            }
+
+    def _release(self, future):
+        if not future.cancelled():
+            future.exception()  # помечаем исключение как обработанное
+        with self._lock:
+            self.pending -= 1
@@ -2,17 +2,32 @@ import logging
 import json
 import asyncio
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from functools import lru_cache
 import os
+import hmac
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from elasticsearch import Elasticsearch, exceptions
+
+import serving
+from cache import LRUCache
+from es_client import ElasticsearchClient
+from inference import InferenceOverloaded, InferencePool
+from matching import lexical_entries, match_exact_and_synonyms, select_semantic
+from multivector import MultiVectorIndex, collect_representations, leaf_items_by_category
+from product_categories import categories as product_tree
+from products import ProductStore
+from profiling import Profiler, ProfilingBusy, memory_breakdown
+from results import ResultRecord, build_fragments, dumps, render_results, render_search_response, top_k
+from serving import SharedCatalog, catalog_fingerprint
+from sharding import ShardRouter
+from suggest import DEFAULT_TOP_K as SUGGEST_TOP_K, SuggestIndex
+from warmup import warm_up_from_env
 
 # Настройка логирования
 logging.basicConfig(
@@ -26,6 +41,9 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# Этапы, прошедшие без ошибок; ответ с другими этапами (*_failed, *_skipped) не кэшируется
+COMPLETE_STAGES = {"exact", "elasticsearch", "semantic"}
+
 app = FastAPI(
     title="Семантический поиск продукции API",
     version="1.0.0",
@@ -35,9 +53,26 @@ app = FastAPI(
 
 # Модели для API
 class SearchRequest(BaseModel):
-    query: str
+    query: str = Field(..., max_length=serving.MAX_QUERY_LENGTH)
     limit: Optional[int] = 10
     threshold: Optional[float] = 0.6
+    deadline_ms: Optional[int] = Field(None, gt=0)  # дедлайн семантического этапа (не больше серверного)
+
+
+class ProductSearchRequest(BaseModel):
+    query: str = Field(..., max_length=serving.MAX_QUERY_LENGTH)
+    threshold: Optional[float] = 0.6
+    limit: Optional[int] = 20  # число товаров
+    category_limit: Optional[int] = 10
+    brands: Optional[List[str]] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    moisture_resistant: Optional[bool] = None
+
+
+class ProfilingToggle(BaseModel):
+    enabled: bool
+    frames: int = Field(10, ge=1)  # глубина стека tracemalloc
 
 
 class SearchResult(BaseModel):
@@ -54,13 +89,22 @@ class SearchResponse(BaseModel):
     processing_time: float
 
 
+# Используем легкую модель для экономии памяти на M2
+MODEL_NAME = 'cointegrated/rubert-tiny2'
+
+
 # Кэширование модели
 @lru_cache(maxsize=1)
 def load_model():
     """Загружаем легкую русскоязычную модель для M2"""
     logger.info("Загружаем модель sentence-transformers...")
-    # Используем легкую модель для экономии памяти на M2
-    model = SentenceTransformer('cointegrated/rubert-tiny2')
+    serving.configure_inference_threads()
+    model = SentenceTransformer(MODEL_NAME)
+    if serving.WORKERS > 1:
+        # Веса одни на все воркеры: отпечаток зависит только от модели
+        model.shared_weight_arrays = serving.share_model_weights(
+            model, SharedCatalog(catalog_fingerprint([], MODEL_NAME))
+        )
     logger.info("Модель загружена успешно")
     return model
 
@@ -134,36 +178,113 @@ class ProductSearchEngine:
                     "synonyms": subcat_data['synonyms']
                 }
 
+        # id категории = позиция в flat_categories; готовые JSON-фрагменты для ответов
+        self.category_ids = {full_name: i for i, full_name in enumerate(self.flat_categories)}
+        self.result_fragments = build_fragments(self.category_mapping)
+        self.lexical_entries = lexical_entries(self.category_mapping)
+
+        # Товары (SKU) найденных категорий с фильтрами и фасетами
+        self.product_store = None
+        if os.path.exists(serving.PRODUCTS_PATH):
+            self.product_store = ProductStore.from_jsonl(serving.PRODUCTS_PATH, self.category_mapping)
+
+        # Префиксный индекс для подсказок при вводе
+        self.suggest_index = SuggestIndex.from_categories(
+            self.category_mapping,
+            min_query_count=serving.SUGGEST_MIN_QUERY_COUNT,
+            max_query_terms=serving.SUGGEST_MAX_QUERY_TERMS
+        )
+        self.suggest_index.load_query_log()
+
         # Инициализация Elasticsearch
-        self.es = None
         self.init_elasticsearch()
 
         # Загружаем модель с кэшированием
         self.model = load_model()
+        # Все вызовы модели из запросов идут через ограниченный пул
+        self.inference_pool = InferencePool.from_env()
+
+        # Кэши эмбеддингов запросов и итоговых результатов (заполняются и прогревом)
+        self.embedding_cache = LRUCache(serving.EMBEDDING_CACHE_SIZE)
+        self.result_cache = LRUCache(serving.RESULT_CACHE_SIZE)
+        self.warmup_report: Optional[Dict] = None
+
+        # Каждая категория представлена несколькими векторами:
+        # полное название, синонимы и товары из product_categories
+        texts, owners, weights = collect_representations(
+            self.category_mapping, leaf_items_by_category(self.category_mapping, product_tree)
+        )
+        vector_settings = f"{serving.VECTOR_PRUNE_THRESHOLD}:{serving.VECTORS_PER_CATEGORY}"
 
-        # Создаем эмбеддинги для категорий
-        logger.info("Создаем эмбеддинги для категорий...")
-        self.category_embeddings = self.model.encode(self.flat_categories)
-        logger.info(f"Созданы эмбеддинги для {len(self.flat_categories)} категорий")
+        # Эмбеддинги и индекс Elasticsearch строит только один воркер,
+        # остальные переиспользуют результат
+        self.shared_catalog = SharedCatalog(
+            catalog_fingerprint(self.flat_categories + texts + [vector_settings], MODEL_NAME)
+        )
+        with self.shared_catalog.leader_lock():
+            arrays = [
+                self.shared_catalog.load_array(name)
+                for name in ("category_vector_owners", "category_vector_weights", "category_vectors")
+            ]
+            # Набор неполон, если предыдущий лидер упал посреди записи - строим заново
+            if any(array is None for array in arrays):
+                logger.info(f"Создаем эмбеддинги для {len(texts)} текстов категорий...")
+                built = MultiVectorIndex.build(
+                    self.model.encode(texts, batch_size=64), owners, weights,
+                    prune_threshold=serving.VECTOR_PRUNE_THRESHOLD,
+                    max_vectors=serving.VECTORS_PER_CATEGORY
+                )
+                # Векторы сохраняются последними: их наличие означает, что набор готов
+                arrays = [
+                    self.shared_catalog.save_array("category_vector_owners", built.owners),
+                    self.shared_catalog.save_array("category_vector_weights", built.weights),
+                    self.shared_catalog.save_array("category_vectors", built.vectors)
+                ]
+                logger.info(f"Созданы эмбеддинги для {len(self.flat_categories)} категорий")
+
+            vector_owners, vector_weights, vectors = arrays
+            self.category_vectors = MultiVectorIndex(
+                vectors, vector_owners, vector_weights, pooling=serving.VECTOR_POOLING
+            )
+
+        self.ensure_elasticsearch_index()
+
+        # Шардированный каталог: точный и семантический этапы рассылаются по шардам
+        self.shard_router = ShardRouter.from_env(self)
+        # Фоновая проверка: при восстановлении Elasticsearch индекс создается заново при необходимости
+        self.es_client.start_prober(on_recovery=self.ensure_elasticsearch_index)
 
     def init_elasticsearch(self):
         """Инициализация Elasticsearch (опционально)"""
-        try:
-            self.es = Elasticsearch([{'host': 'localhost', 'port': 9200, 'scheme': 'http'}])
-            if self.es.ping():
-                logger.info("Elasticsearch подключен")
-                self.setup_elasticsearch_index()
-            else:
-                logger.warning("Elasticsearch недоступен, используем только векторный поиск")
-                self.es = None
-        except Exception as e:
-            logger.warning(f"Ошибка подключения к Elasticsearch: {e}")
-            self.es = None
+        self.es_client = ElasticsearchClient.from_env()
+        if self.es_client.probe():
+            logger.info("Elasticsearch подключен")
+        else:
+            logger.warning("Elasticsearch недоступен, используем только векторный поиск")
+
+    def ensure_elasticsearch_index(self):
+        """Создать индекс, если его нет для текущего каталога (только один воркер)"""
+        if not self.es_client.available:
+            return
+
+        with self.shared_catalog.leader_lock():
+            try:
+                if self.shared_catalog.es_indexed() and self.es_client.es.indices.exists(index="products"):
+                    return
+            except Exception as e:
+                logger.warning(f"Ошибка проверки индекса Elasticsearch: {e}")
+                return
+
+            if self.setup_elasticsearch_index():
+                self.shared_catalog.mark_es_indexed()
 
-    def setup_elasticsearch_index(self):
+    def setup_elasticsearch_index(self) -> bool:
         """Настройка индекса Elasticsearch с русскоязычным анализатором"""
-        if not self.es:
-            return
+        if not self.es_client.available:
+            return False
+
+        # Административные операции не ограничены коротким таймаутом поиска
+        es = self.es_client.es.options(request_timeout=30)
 
         index_name = "products"
 
@@ -202,11 +323,11 @@ class ProductSearchEngine:
 
         try:
             # Удаляем индекс если существует
-            if self.es.indices.exists(index=index_name):
-                self.es.indices.delete(index=index_name)
+            if es.indices.exists(index=index_name):
+                es.indices.delete(index=index_name)
 
             # Создаем новый индекс
-            self.es.indices.create(index=index_name, body=index_settings)
+            es.indices.create(index=index_name, body=index_settings)
 
             # Индексируем данные
             for full_name, mapping in self.category_mapping.items():
@@ -216,130 +337,173 @@ class ProductSearchEngine:
                     "synonyms": " ".join(mapping["synonyms"]),
                     "full_name": full_name
                 }
-                self.es.index(index=index_name, body=doc)
+                es.index(index=index_name, body=doc)
 
-            self.es.indices.refresh(index=index_name)
+            es.indices.refresh(index=index_name)
             logger.info("Elasticsearch индекс создан и заполнен")
+            return True
 
         except Exception as e:
             logger.error(f"Ошибка настройки Elasticsearch: {e}")
+            return False
 
-    def search_exact_and_synonyms(self, query: str) -> List[Tuple[str, float, str]]:
+    def search_exact_and_synonyms(self, query: str, limit: Optional[int] = None) -> List[Tuple[int, float, str]]:
         """Поиск по точным совпадениям и синонимам"""
-        results = []
-        query_lower = query.lower().strip()
+        if self.shard_router:
+            return self.shard_router.search_lexical(query, limit or len(self.flat_categories))
+        return match_exact_and_synonyms(query, self.lexical_entries)
 
-        for full_name, mapping in self.category_mapping.items():
-            # Проверяем точное совпадение с названием категории
-            if query_lower in mapping["subcategory_name"].lower():
-                results.append((full_name, 1.0, "exact"))
-                continue
-
-            # Проверяем синонимы
-            for synonym in mapping["synonyms"]:
-                if query_lower in synonym.lower() or synonym.lower() in query_lower:
-                    results.append((full_name, 0.9, "synonym"))
-                    break
-
-        return results
-
-    def search_semantic(self, query: str, threshold: float = 0.6) -> List[Tuple[str, float, str]]:
-        """Семантический поиск через эмбеддинги"""
+    def search_semantic(self, query: str, threshold: float = 0.6,
+                        limit: Optional[int] = None) -> Optional[List[Tuple[int, float, str]]]:
+        """Семантический поиск через эмбеддинги (None - ошибка, а не пустой ответ)"""
         try:
-            query_embedding = self.model.encode([query])
-            similarities = cosine_similarity(query_embedding, self.category_embeddings)[0]
-
-            results = []
-            for i, score in enumerate(similarities):
-                if score >= threshold:
-                    results.append((self.flat_categories[i], float(score), "semantic"))
-
-            return sorted(results, key=lambda x: x[1], reverse=True)
+            query_embedding = self.embedding_cache.get(query)
+            if query_embedding is None:
+                query_embedding = self.model.encode([query])[0]
+                self.embedding_cache.put(query, query_embedding)
+            if self.shard_router:
+                return self.shard_router.search_semantic(
+                    query_embedding, threshold, limit or len(self.flat_categories)
+                )
+            return select_semantic(self.category_vectors.score(query_embedding), threshold)
         except Exception as e:
             logger.error(f"Ошибка семантического поиска: {e}")
-            return []
+            return None
 
-    def search_elasticsearch(self, query: str) -> List[Tuple[str, float, str]]:
-        """Поиск через Elasticsearch"""
-        if not self.es:
+    def search_elasticsearch(self, query: str) -> Optional[List[Tuple[int, float, str]]]:
+        """Поиск через Elasticsearch (пропускается при разомкнутой цепи; None - ошибка запроса)"""
+        if not self.es_client.available:
             return []
 
-        try:
-            search_body = {
-                "query": {
-                    "multi_match": {
-                        "query": query,
-                        "fields": ["category^2", "subcategory^3", "synonyms^1.5", "full_name^2"],
-                        "type": "best_fields",
-                        "fuzziness": "AUTO"
-                    }
-                },
-                "size": 20
-            }
+        search_body = {
+            "query": {
+                "multi_match": {
+                    "query": query,
+                    "fields": ["category^2", "subcategory^3", "synonyms^1.5", "full_name^2"],
+                    "type": "best_fields",
+                    "fuzziness": "AUTO"
+                }
+            },
+            "size": 20
+        }
 
-            response = self.es.search(index="products", body=search_body)
-            results = []
+        # Таймаут, учет ошибок и логирование - в ElasticsearchClient
+        response = self.es_client.search(index="products", body=search_body)
+        if response is None:
+            return None
 
-            for hit in response['hits']['hits']:
-                full_name = hit['_source']['full_name']
-                score = float(hit['_score']) / 10.0  # Нормализуем скор
-                results.append((full_name, min(score, 1.0), "elasticsearch"))
+        results = []
+        for hit in response['hits']['hits']:
+            category_id = self.category_ids.get(hit['_source']['full_name'])
+            if category_id is None:
+                continue
+            score = float(hit['_score']) / 10.0  # Нормализуем скор
+            results.append((category_id, min(score, 1.0), "elasticsearch"))
 
-            return results
+        return results
 
-        except Exception as e:
-            logger.error(f"Ошибка поиска в Elasticsearch: {e}")
-            return []
+    async def search_stages(self, query: str, threshold: float = 0.6, deadline: Optional[float] = None,
+                            limit: Optional[int] = None) -> AsyncIterator[Tuple[str, List[Tuple[int, float, str]]]]:
+        """Этапы поиска по мере готовности: (этап, результаты этапа).
+
+        Ошибка этапа отдается как "<этап>_failed" с пустыми результатами,
+        чтобы ее можно было отличить от этапа без совпадений.
+        """
+        loop = asyncio.get_running_loop()
+
+        # 1. Точный поиск и синонимы (высший приоритет)
+        if self.shard_router:
+            yield "exact", await loop.run_in_executor(None, self.search_exact_and_synonyms, query, limit)
+        else:
+            yield "exact", self.search_exact_and_synonyms(query)
+
+        # 2. Elasticsearch поиск (в отдельном потоке, чтобы не блокировать цикл событий)
+        es_results = await loop.run_in_executor(None, self.search_elasticsearch, query)
+        if es_results is None:
+            yield "elasticsearch_failed", []
+        else:
+            yield "elasticsearch", es_results
+
+        # 3. Семантический поиск (через пул инференса с контролем допуска)
+        try:
+            semantic_results = await self.inference_pool.run(
+                self.search_semantic, query, threshold, limit, deadline=deadline
+            )
+        except InferenceOverloaded as e:
+            if serving.OVERLOAD_POLICY != "degrade":
+                raise
+            # Деградируем до лексического ответа вместо отказа
+            self.inference_pool.record_degraded()
+            logger.warning(f"Семантический поиск пропущен: {e}")
+            yield "semantic_skipped", []
+            return
+        if semantic_results is None:
+            yield "semantic_failed", []
+        else:
+            yield "semantic", semantic_results
+
+    async def collect_results(self, query: str, threshold: float = 0.6, limit: int = 10,
+                              deadline: Optional[float] = None) -> List[ResultRecord]:
+        """Все этапы поиска и top-k с кэшированием полных (без пропущенных и упавших этапов) ответов"""
+        # Доступность Elasticsearch входит в ключ: ответ без лексического этапа
+        # не должен переживать восстановление Elasticsearch
+        cache_key = (query, threshold, limit, self.es_client.available)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Счетчик частичных ответов шардов: если он вырос за время запроса,
+        # ответ не кэшируется (консервативно - рост мог вызвать и соседний запрос)
+        partial_before = self.shard_router.partial if self.shard_router else 0
 
-    async def search(self, query: str, threshold: float = 0.6, limit: int = 10) -> List[SearchResult]:
+        all_results = []
+        complete = True
+        async for stage, stage_results in self.search_stages(query, threshold, deadline, limit):
+            complete = complete and stage in COMPLETE_STAGES
+            all_results.extend(stage_results)
+
+        # Удаляем дубликаты и отбираем top-k по релевантности; записи
+        # результатов создаются только для попавших в ответ категорий
+        top_results = top_k(all_results, limit)
+        if self.shard_router and self.shard_router.partial != partial_before:
+            complete = False
+        if complete:
+            self.result_cache.put(cache_key, top_results)
+        return top_results
+
+    async def search(self, query: str, threshold: float = 0.6, limit: int = 10,
+                     deadline: Optional[float] = None) -> List[ResultRecord]:
         """Основной метод поиска, комбинирующий все подходы"""
         start_time = datetime.now()
 
         # Логируем запрос
         logger.info(f"Поиск: '{query}' (threshold={threshold}, limit={limit})")
 
-        all_results = []
-
-        # 1. Точный поиск и синонимы (высший приоритет)
-        exact_results = self.search_exact_and_synonyms(query)
-        all_results.extend(exact_results)
-
-        # 2. Elasticsearch поиск
-        es_results = self.search_elasticsearch(query)
-        all_results.extend(es_results)
+        top_results = await self.collect_results(query, threshold, limit, deadline)
 
-        # 3. Семантический поиск
-        semantic_results = self.search_semantic(query, threshold)
-        all_results.extend(semantic_results)
+        # Успешные запросы повышают вес подсказок
+        if top_results:
+            self.suggest_index.record_query(query)
 
-        # Удаляем дубликаты и сортируем по релевантности
-        seen = set()
-        unique_results = []
-
-        for full_name, score, method in all_results:
-            if full_name not in seen:
-                seen.add(full_name)
-                mapping = self.category_mapping[full_name]
-
-                result = SearchResult(
-                    category=mapping["category_name"],
-                    subcategory=mapping["subcategory_name"],
-                    score=score,
-                    method=method
-                )
-                unique_results.append(result)
+        processing_time = (datetime.now() - start_time).total_seconds()
+        logger.info(f"Поиск завершен за {processing_time:.3f}с, найдено {len(top_results)} результатов: '{query}'")
 
-        # Сортируем по релевантности
-        unique_results.sort(key=lambda x: (-x.score, x.method != "exact"))
+        return top_results
 
-        processing_time = (datetime.now() - start_time).total_seconds()
-        logger.info(f"Поиск завершен за {processing_time:.3f}с, найдено {len(unique_results)} результатов")
 
-        return unique_results[:limit]
+# Глобальный экземпляр поискового движка.
+# При запуске с несколькими воркерами родительский процесс uvicorn только
+# управляет ими, движок создается в каждом воркере при импорте модуля
+if __name__ == "__main__" and serving.WORKERS > 1:
+    search_engine = None
+else:
+    search_engine = ProductSearchEngine()
 
 
-# Глобальный экземпляр поискового движка
-search_engine = ProductSearchEngine()
+@app.on_event("startup")
+async def warm_up_caches():
+    """Прогрев кэшей до начала приема запросов"""
+    search_engine.warmup_report = await warm_up_from_env(search_engine)
 
 
 @app.get("/")
@@ -351,6 +515,9 @@ async def root():
         "description": "API для семантического поиска строительных материалов",
         "endpoints": {
             "search": "POST /search - Поиск продукции",
+            "search_stream": "POST /search/stream - Потоковый поиск (NDJSON по этапам)",
+            "products_search": "POST /products/search - Поиск товаров с фильтрами и фасетами",
+            "suggest": "GET /suggest?q=... - Подсказки при вводе",
             "categories": "GET /categories - Получить все категории",
             "health": "GET /health - Проверка работоспособности",
             "docs": "GET /docs - Swagger документация"
@@ -374,23 +541,129 @@ async def search_products(search_request: SearchRequest):
         results = await search_engine.search(
             query=search_request.query,
             threshold=search_request.threshold,
-            limit=search_request.limit
+            limit=search_request.limit,
+            deadline=search_request.deadline_ms / 1000.0 if search_request.deadline_ms else None
         )
 
         processing_time = (datetime.now() - start_time).total_seconds()
 
-        return SearchResponse(
-            query=search_request.query,
-            results=results,
-            total=len(results),
-            processing_time=processing_time
+        # Тело собирается из готовых JSON-фрагментов, response_model
+        # остается только для документации (повторной валидации нет)
+        return Response(
+            content=render_search_response(
+                search_request.query, results, search_engine.result_fragments, processing_time
+            ),
+            media_type="application/json"
         )
 
+    except InferenceOverloaded as e:
+        logger.warning(f"Запрос отклонен: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         logger.error(f"Ошибка поиска: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/search/stream")
+async def search_products_stream(search_request: SearchRequest):
+    """Потоковый поиск: NDJSON-строка на каждый этап по мере готовности"""
+    query = search_request.query
+    limit = search_request.limit
+    deadline = search_request.deadline_ms / 1000.0 if search_request.deadline_ms else None
+
+    async def generate():
+        start_time = datetime.now()
+        logger.info(f"Поиск: '{query}' (threshold={search_request.threshold}, limit={limit}, stream)")
+
+        seen = set()
+        total = 0
+        try:
+            async for stage, stage_results in search_engine.search_stages(
+                    query, search_request.threshold, deadline, limit):
+                fresh = top_k((r for r in stage_results if r[0] not in seen), limit)
+                seen.update(r[0] for r in stage_results)
+                total += len(fresh)
+
+                elapsed = (datetime.now() - start_time).total_seconds()
+                yield (
+                    b'{"stage":' + dumps(stage)
+                    + b',"results":' + render_results(fresh, search_engine.result_fragments)
+                    + b',"elapsed":' + repr(elapsed).encode() + b"}\n"
+                )
+        except InferenceOverloaded as e:
+            logger.warning(f"Запрос отклонен: {e}")
+            yield dumps({"stage": "error", "detail": str(e)}) + b"\n"
+
+        if total:
+            search_engine.suggest_index.record_query(query)
+
+        processing_time = (datetime.now() - start_time).total_seconds()
+        logger.info(f"Поиск завершен за {processing_time:.3f}с, найдено {len(seen)} результатов: '{query}'")
+        yield dumps({
+            "stage": "done",
+            "query": query,
+            "total": len(seen) if limit is None else min(len(seen), limit),
+            "processing_time": processing_time
+        }) + b"\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.post("/products/search")
+async def search_skus(search_request: ProductSearchRequest):
+    """Поиск товаров: категории запроса + фильтры по атрибутам, фасеты и top-k"""
+    if search_engine.product_store is None:
+        raise HTTPException(status_code=404, detail="Каталог товаров не загружен")
+
+    start_time = datetime.now()
+
+    try:
+        categories = await search_engine.search(
+            query=search_request.query,
+            threshold=search_request.threshold,
+            limit=search_request.category_limit
+        )
+
+        products = search_engine.product_store.search(
+            {r.category_id: r.score for r in categories},
+            limit=search_request.limit,
+            brands=search_request.brands,
+            price_min=search_request.price_min,
+            price_max=search_request.price_max,
+            moisture_resistant=search_request.moisture_resistant
+        )
+
+        processing_time = (datetime.now() - start_time).total_seconds()
+        return Response(
+            content=(
+                b'{"query":' + dumps(search_request.query)
+                + b',"categories":' + render_results(categories, search_engine.result_fragments)
+                + b',"products":' + dumps(products["products"])
+                + b',"total":' + str(products["total"]).encode()
+                + b',"facets":' + dumps(products["facets"])
+                + b',"processing_time":' + repr(processing_time).encode()
+                + b"}"
+            ),
+            media_type="application/json"
+        )
+
+    except InferenceOverloaded as e:
+        logger.warning(f"Запрос отклонен: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        logger.error(f"Ошибка поиска товаров: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/suggest")
+async def suggest(q: str, limit: int = Query(10, ge=1, le=SUGGEST_TOP_K)):
+    """Подсказки при вводе по префиксному индексу (без обращения к модели)"""
+    return {
+        "query": q,
+        "suggestions": search_engine.suggest_index.suggest(q, limit=limit)
+    }
+
+
 @app.get("/categories")
 async def get_categories():
     """Получить все категории и подкатегории"""
@@ -408,8 +681,8 @@ async def health_check():
         # Проверяем модель
         model_status = "ok" if search_engine.model else "error"
 
-        # Проверяем Elasticsearch
-        es_status = "ok" if search_engine.es and search_engine.es.ping() else "unavailable"
+        # Состояние Elasticsearch берется из кэша фоновой проверки (без сетевого запроса)
+        es_status = search_engine.es_client.health()["status"]
 
         return {
             "status": "healthy",
@@ -431,9 +704,16 @@ async def get_stats():
         # Читаем логи для подсчета статистики
         stats = {
             "total_categories": len(search_engine.flat_categories),
-            "model_name": "cointegrated/rubert-tiny2",
-            "elasticsearch_available": search_engine.es is not None,
-            "supported_methods": ["exact", "synonym", "semantic", "elasticsearch"]
+            "model_name": MODEL_NAME,
+            "elasticsearch_available": search_engine.es_client.available,
+            "elasticsearch": search_engine.es_client.health(),
+            "result_cache": search_engine.result_cache.stats(),
+            "embedding_cache": search_engine.embedding_cache.stats(),
+            "warmup": search_engine.warmup_report,
+            "shards": search_engine.shard_router.stats() if search_engine.shard_router else None,
+            "products": len(search_engine.product_store) if search_engine.product_store else 0,
+            "supported_methods": ["exact", "synonym", "semantic", "elasticsearch"],
+            "inference_pool": search_engine.inference_pool.stats()
         }
 
         # Можно добавить статистику из логов
@@ -450,7 +730,74 @@ async def get_stats():
         raise HTTPException(status_code=500, detail=f"Stats error: {str(e)}")
 
 
+# Профилирование по запросу (служебные эндпоинты, состояние свое у каждого воркера)
+profiler = Profiler(enabled=serving.PROFILING_ENABLED)
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Доступ к /admin только с токеном; без SEARCH_ADMIN_TOKEN эндпоинты скрыты"""
+    if not serving.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, serving.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Неверный токен администратора")
+
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling():
+    """Состояние профилирования"""
+    return {"pid": os.getpid(), **profiler.state()}
+
+
+@app.post("/admin/profiling", dependencies=[Depends(require_admin)])
+async def set_profiling(toggle: ProfilingToggle):
+    """Включение и выключение профилирования во время работы"""
+    profiler.set_enabled(toggle.enabled)
+    return {"pid": os.getpid(), **profiler.state()}
+
+
+@app.get("/admin/profile/cpu", dependencies=[Depends(require_admin)])
+async def profile_cpu(seconds: float = 10.0, interval_ms: float = 5.0, include_idle: bool = False):
+    """Семплированный профиль CPU за seconds секунд (collapsed stacks для flamegraph.pl/speedscope)"""
+    loop = asyncio.get_running_loop()
+    try:
+        stacks = await loop.run_in_executor(
+            None, profiler.sample_cpu, seconds, max(interval_ms, 1.0) / 1000.0, include_idle
+        )
+    except ProfilingBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(stacks)
+
+
+@app.post("/admin/memory/tracemalloc", dependencies=[Depends(require_admin)])
+async def toggle_tracemalloc(toggle: ProfilingToggle):
+    """Запуск (с новым базовым снимком) и остановка tracemalloc"""
+    try:
+        if toggle.enabled:
+            profiler.start_tracemalloc(toggle.frames)
+        else:
+            profiler.stop_tracemalloc()
+    except ProfilingBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"pid": os.getpid(), **profiler.state()}
+
+
+@app.get("/admin/memory", dependencies=[Depends(require_admin)])
+async def get_memory(top: int = 20, reset: bool = False):
+    """Память по компонентам движка и разница tracemalloc с базовым снимком"""
+    loop = asyncio.get_running_loop()
+    breakdown = await loop.run_in_executor(None, memory_breakdown, search_engine)
+    return {
+        "pid": os.getpid(),
+        **breakdown,
+        "tracemalloc": await loop.run_in_executor(None, profiler.tracemalloc_diff, top, reset)
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    if serving.WORKERS > 1:
+        # Воркеры импортируют приложение по строке "main:app"
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=serving.WORKERS)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Запись для точного поиска: (id категории, название подкатегории, синонимы) в нижнем регистре
+LexicalEntry = Tuple[int, str, List[str]]
+
+
+def lexical_entries(category_mapping: Dict[str, Dict]) -> List[LexicalEntry]:
+    """Заранее приведенные к нижнему регистру названия и синонимы категорий"""
+    return [
+        (category_id, mapping["subcategory_name"].lower(), [s.lower() for s in mapping["synonyms"]])
+        for category_id, mapping in enumerate(category_mapping.values())
+    ]
+
+
+def match_exact_and_synonyms(query: str, entries: List[LexicalEntry]) -> List[Tuple[int, float, str]]:
+    """Поиск по точным совпадениям и синонимам"""
+    results = []
+    query_lower = query.lower().strip()
+
+    for category_id, subcategory_name, synonyms in entries:
+        # Проверяем точное совпадение с названием категории
+        if query_lower in subcategory_name:
+            results.append((category_id, 1.0, "exact"))
+            continue
+
+        # Проверяем синонимы
+        for synonym in synonyms:
+            if query_lower in synonym or synonym in query_lower:
+                results.append((category_id, 0.9, "synonym"))
+                break
+
+    return results
+
+
+def select_semantic(similarities: np.ndarray, threshold: float, category_ids: Optional[np.ndarray] = None,
+                    limit: Optional[int] = None) -> List[Tuple[int, float, str]]:
+    """Категории со сходством не ниже порога, по убыванию сходства.
+
+    category_ids переводит позиции в similarities в глобальные id (для шардов).
+    """
+    # Отбор и сортировка по порогу на массиве, кортежи только для прошедших
+    ids = np.flatnonzero(similarities >= threshold)
+    if limit is not None and len(ids) > limit:
+        ids = ids[np.argpartition(-similarities[ids], limit - 1)[:limit]]
+    ids = ids[np.argsort(-similarities[ids], kind="stable")]
+
+    if category_ids is None:
+        return [(int(i), float(similarities[i]), "semantic") for i in ids]
+    return [(int(category_ids[i]), float(similarities[i]), "semantic") for i in ids]
+
+
+def rank_key(result: Tuple[int, float, str]):
+    """Порядок результатов: по убыванию скора, точные совпадения выше при равенстве.
+
+    Последний ключ - id категории, чтобы при равных скорах слияние шардов давало
+    тот же порядок, что и поиск без шардов (категории в порядке id).
+    """
+    return -result[1], result[2] != "exact", result[0]
+
+
+def merge_top(per_source: List[List[Tuple[int, float, str]]], limit: int) -> List[Tuple[int, float, str]]:
+    """Слияние отсортированных списков источников (шардов) с отбором top-k через кучу"""
+    merged = heapq.merge(*(sorted(results, key=rank_key) for results in per_source), key=rank_key)
+    return [result for _, result in zip(range(limit), merged)]
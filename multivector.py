@@ -0,0 +1,139 @@
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Вес сходства по типу текста: название и синонимы описывают категорию целиком,
+# конкретный товар - лишь ее часть
+NAME_WEIGHT = 1.0
+SYNONYM_WEIGHT = 1.0
+LEAF_WEIGHT = 0.9
+
+_KMEANS_ITERATIONS = 5
+
+
+def _stem(name: str) -> str:
+    # "Краски" и "Краска" - одна подкатегория, "Плитка ПВХ" и "Плитка" - разные
+    return name.lower().replace("ё", "е").strip().rstrip("аияыь")
+
+
+def leaf_items_by_category(category_mapping: Dict[str, Dict], tree: Dict[str, Dict[str, List[str]]]) -> Dict[str, List[str]]:
+    """Товары из дерева product_categories для подкатегорий поискового каталога"""
+    leaves = {}
+    for category_name, subcategories in tree.items():
+        for subcategory_name, items in subcategories.items():
+            leaves[(_stem(category_name), _stem(subcategory_name))] = items
+
+    return {
+        full_name: leaves.get((_stem(mapping["category_name"]), _stem(mapping["subcategory_name"])), [])
+        for full_name, mapping in category_mapping.items()
+    }
+
+
+def collect_representations(category_mapping: Dict[str, Dict],
+                            leaf_items: Dict[str, List[str]]) -> Tuple[List[str], List[int], List[float]]:
+    """Тексты для векторов категорий: (тексты, id категории, веса), сгруппированы по категориям"""
+    texts, owners, weights = [], [], []
+    for category_id, (full_name, mapping) in enumerate(category_mapping.items()):
+        entries = [(full_name, NAME_WEIGHT)]
+        entries += [(synonym, SYNONYM_WEIGHT) for synonym in mapping["synonyms"]]
+        entries += [(item, LEAF_WEIGHT) for item in leaf_items.get(full_name, [])]
+        for text, weight in entries:
+            texts.append(text)
+            owners.append(category_id)
+            weights.append(weight)
+    return texts, owners, weights
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class MultiVectorIndex:
+    """Несколько нормированных векторов на категорию и пулинг сходства по категории.
+
+    Векторы одной категории лежат подряд, поэтому пулинг - это один
+    reduceat по сегментам после единственного матричного умножения.
+    """
+
+    def __init__(self, vectors: np.ndarray, owners: np.ndarray, weights: np.ndarray, pooling: str = "max"):
+        self.vectors = vectors
+        self.owners = np.asarray(owners, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self.pooling = pooling
+        self.offsets = np.flatnonzero(np.r_[True, self.owners[1:] != self.owners[:-1]])
+        self.n_categories = len(self.offsets)
+        self._weight_sums = np.add.reduceat(self.weights, self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.owners)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, owners: List[int], weights: List[float],
+              prune_threshold: float = 0.0, max_vectors: int = 0, pooling: str = "max") -> "MultiVectorIndex":
+        """Построение с необязательным прунингом дублей и сжатием до центроидов"""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        owners = np.asarray(owners, dtype=np.int32)
+        weights = np.asarray(weights, dtype=np.float32)
+
+        kept_vectors, kept_owners, kept_weights = [], [], []
+        for category_id in np.unique(owners):
+            rows = np.flatnonzero(owners == category_id)
+            cat_vectors, cat_weights = vectors[rows], weights[rows]
+
+            if prune_threshold > 0:
+                cat_vectors, cat_weights = cls._prune(cat_vectors, cat_weights, prune_threshold)
+            if max_vectors > 0 and len(cat_vectors) > max_vectors:
+                cat_vectors, cat_weights = cls._compress(cat_vectors, cat_weights, max_vectors)
+
+            kept_vectors.append(cat_vectors)
+            kept_weights.append(cat_weights)
+            kept_owners.append(np.full(len(cat_vectors), category_id, dtype=np.int32))
+
+        index = cls(np.vstack(kept_vectors), np.concatenate(kept_owners), np.concatenate(kept_weights), pooling)
+        logger.info(f"Векторов категорий: {len(index)} из {len(owners)} для {index.n_categories} категорий")
+        return index
+
+    @staticmethod
+    def _prune(vectors: np.ndarray, weights: np.ndarray, threshold: float) -> Tuple[np.ndarray, np.ndarray]:
+        """Удаление почти совпадающих векторов (первый - название - всегда сохраняется)"""
+        keep = [0]
+        for i in range(1, len(vectors)):
+            if float(np.max(vectors[keep] @ vectors[i])) < threshold:
+                keep.append(i)
+        return vectors[keep], weights[keep]
+
+    @staticmethod
+    def _compress(vectors: np.ndarray, weights: np.ndarray, max_vectors: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Сжатие до max_vectors: название + центроиды сферического k-means по остальным"""
+        if max_vectors == 1:
+            return vectors[:1], weights[:1]
+
+        rest, rest_weights = vectors[1:], weights[1:]
+        k = max_vectors - 1
+        centroids = rest[:k].copy()
+        for _ in range(_KMEANS_ITERATIONS):
+            assignment = np.argmax(rest @ centroids.T, axis=1)
+            for c in range(k):
+                members = rest[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+
+        assignment = np.argmax(rest @ centroids.T, axis=1)
+        centroid_weights = np.array([
+            rest_weights[assignment == c].mean() if np.any(assignment == c) else 0.0
+            for c in range(k)
+        ], dtype=np.float32)
+        used = centroid_weights > 0
+        return np.vstack([vectors[:1], centroids[used]]), np.concatenate([weights[:1], centroid_weights[used]])
+
+    def score(self, query_vector: np.ndarray) -> np.ndarray:
+        """Сходство запроса с каждой категорией (max или взвешенное среднее по векторам)"""
+        similarities = self.vectors @ _normalize(np.asarray(query_vector, dtype=np.float32).ravel())
+        if self.pooling == "mean":
+            return np.add.reduceat(similarities * self.weights, self.offsets) / self._weight_sums
+        return np.maximum.reduceat(similarities * self.weights, self.offsets)
@@ -0,0 +1,209 @@
+import argparse
+import json
+import logging
+import random
+from typing import Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Число интервалов фасета цены
+PRICE_BUCKETS = 5
+
+
+class ProductStore:
+    """Колоночное хранилище товаров (SKU) с инвертированным индексом по категориям.
+
+    Строки упорядочены по (категория, убывание популярности), поэтому список
+    позиций категории - непрерывный срез, а колонки атрибутов (numpy) читаются
+    без копирования. Бренд словарно закодирован, влагостойкость - булев
+    столбец (байт на товар, маска без распаковки), цена дополнительно
+    хранится номером интервала фасета. Строковые поля читаются только для
+    итогового top-k.
+    """
+
+    def __init__(self, records: List[Dict], category_ids: Dict[tuple, int]):
+        # (категория, подкатегория) по id категории каталога - для выдачи
+        self.category_names = {category_id: key for key, category_id in category_ids.items()}
+        lookup = {(c.lower(), s.lower()): category_id for (c, s), category_id in category_ids.items()}
+        category_of = [lookup.get((r["category"].lower(), r["subcategory"].lower()), -1) for r in records]
+        order = sorted(range(len(records)), key=lambda i: (category_of[i], -records[i].get("popularity", 0.0)))
+        records = [records[i] for i in order]
+        n = len(records)
+
+        self.skus = [r["sku"] for r in records]
+        self.names = [r["name"] for r in records]
+
+        self.brands: List[str] = sorted({r.get("brand", "") for r in records})
+        brand_codes = {brand: code for code, brand in enumerate(self.brands)}
+
+        self.category_id = np.array([category_of[i] for i in order], dtype=np.int32)
+        self.brand_id = np.fromiter((brand_codes[r.get("brand", "")] for r in records), dtype=np.int32, count=n)
+        self.price = np.fromiter((r.get("price", 0.0) for r in records), dtype=np.float32, count=n)
+        self.moisture_resistant = np.fromiter(
+            (bool(r.get("moisture_resistant", False)) for r in records), dtype=np.bool_, count=n
+        )
+        self.popularity = np.fromiter((r.get("popularity", 0.0) for r in records), dtype=np.float32, count=n)
+
+        # Интервалы фасета цены - квантили по всему каталогу
+        self.price_edges = np.round(np.quantile(self.price, np.linspace(0, 1, PRICE_BUCKETS + 1)), 2) if n else np.zeros(2)
+        self.price_bucket = np.clip(
+            np.searchsorted(self.price_edges, self.price, side="right") - 1, 0, len(self.price_edges) - 2
+        ).astype(np.uint8)
+
+        # Инвертированный индекс: категория -> срез строк [start, end)
+        values, starts = np.unique(self.category_id, return_index=True)
+        bounds = list(starts[1:]) + [n]
+        self.category_ranges = {int(v): (int(s), int(e)) for v, s, e in zip(values, starts, bounds) if v >= 0}
+
+        unmatched = int(np.sum(self.category_id < 0))
+        if unmatched:
+            logger.warning(f"Товаров без категории каталога: {unmatched}")
+        logger.info(f"Загружено товаров: {n}, брендов: {len(self.brands)}")
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+    @classmethod
+    def from_jsonl(cls, path: str, category_mapping: Dict[str, Dict]) -> "ProductStore":
+        """Загрузка товаров из JSONL; категория товара сопоставляется по названиям"""
+        category_ids = {
+            (mapping["category_name"], mapping["subcategory_name"]): category_id
+            for category_id, mapping in enumerate(category_mapping.values())
+        }
+        with open(path, "r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return cls(records, category_ids)
+
+    def search(self, category_scores: Dict[int, float], limit: Optional[int] = 20, brands: Optional[List[str]] = None,
+               price_min: Optional[float] = None, price_max: Optional[float] = None,
+               moisture_resistant: Optional[bool] = None) -> Dict:
+        """Товары найденных категорий с фильтрами, фасетами и top-k.
+
+        Скор товара - скор категории плюс небольшая добавка за популярность.
+        Фасеты бренда и влагостойкости считаются без собственного фильтра.
+        """
+        allowed_brands = None
+        if brands:
+            allowed_brands = np.zeros(len(self.brands), dtype=np.bool_)
+            allowed_brands[[self.brands.index(b) for b in brands if b in self.brands]] = True
+
+        brand_counts = np.zeros(len(self.brands), dtype=np.int64)
+        price_counts = np.zeros(len(self.price_edges) - 1, dtype=np.int64)
+        moisture_true = moisture_total = total = 0
+        candidates, candidate_scores = [], []
+
+        for category_id, category_score in category_scores.items():
+            if category_id not in self.category_ranges:
+                continue
+            start, end = self.category_ranges[category_id]
+            size = end - start
+
+            # Векторные маски фильтров по срезам колонок (None - фильтра нет)
+            price_mask = None
+            if price_min is not None or price_max is not None:
+                price = self.price[start:end]
+                price_mask = np.ones(size, dtype=np.bool_)
+                if price_min is not None:
+                    price_mask &= price >= price_min
+                if price_max is not None:
+                    price_mask &= price <= price_max
+            brand_mask = allowed_brands[self.brand_id[start:end]] if allowed_brands is not None else None
+            moisture_mask = None
+            if moisture_resistant is not None:
+                moisture_mask = self.moisture_resistant[start:end] == moisture_resistant
+
+            brand_facet_mask = _combine(size, price_mask, moisture_mask)
+            moisture_facet_mask = _combine(size, price_mask, brand_mask)
+            mask = _combine(size, brand_facet_mask, brand_mask)
+
+            brand_counts += np.bincount(self.brand_id[start:end][brand_facet_mask], minlength=len(self.brands))
+            moisture_true += int(np.count_nonzero(self.moisture_resistant[start:end] & moisture_facet_mask))
+            moisture_total += int(np.count_nonzero(moisture_facet_mask))
+            price_counts += np.bincount(self.price_bucket[start:end][mask], minlength=len(price_counts))
+
+            # Внутри категории строки уже отсортированы по популярности: top-k - первые совпавшие
+            matched = np.flatnonzero(mask)
+            total += len(matched)
+            rows = matched[:limit] + start
+            candidates.append(rows)
+            candidate_scores.append(category_score + 0.01 * self.popularity[rows])
+
+        if not candidates:
+            rows, scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        else:
+            rows, scores = np.concatenate(candidates), np.concatenate(candidate_scores)
+        top = np.argsort(-scores, kind="stable")[:limit]
+
+        return {
+            "total": total,
+            "products": [self._product(int(rows[i]), float(scores[i])) for i in top],
+            "facets": {
+                "brand": {self.brands[code]: int(count) for code, count in enumerate(brand_counts) if count},
+                "moisture_resistant": {"true": moisture_true, "false": moisture_total - moisture_true},
+                "price": [
+                    {"from": float(self.price_edges[i]), "to": float(self.price_edges[i + 1]), "count": int(count)}
+                    for i, count in enumerate(price_counts)
+                ]
+            }
+        }
+
+    def _product(self, row: int, score: float) -> Dict:
+        return {
+            "sku": self.skus[row],
+            "name": self.names[row],
+            "brand": self.brands[self.brand_id[row]],
+            "price": float(self.price[row]),
+            "moisture_resistant": bool(self.moisture_resistant[row]),
+            "category": self.category_names[int(self.category_id[row])][0],
+            "subcategory": self.category_names[int(self.category_id[row])][1],
+            "score": round(score, 4)
+        }
+
+
+def _combine(size: int, *masks: Optional[np.ndarray]) -> np.ndarray:
+    """Логическое И масок; отсутствующие маски пропускаются"""
+    present = [m for m in masks if m is not None]
+    if not present:
+        return np.ones(size, dtype=np.bool_)
+    combined = present[0]
+    for m in present[1:]:
+        combined = combined & m
+    return combined
+
+
+def generate(sample_path: str, output_path: str, count: int, seed: int = 0):
+    """Синтетический каталог заданного размера на основе примеров (для нагрузочных замеров)"""
+    with open(sample_path, "r", encoding="utf-8") as f:
+        templates = [json.loads(line) for line in f if line.strip()]
+
+    rng = random.Random(seed)
+    brands = sorted({t["brand"] for t in templates}) + [f"Бренд {i}" for i in range(50)]
+    with open(output_path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            template = templates[i % len(templates)]
+            record = dict(template)
+            record["sku"] = f"SKU-{i + 1:07d}"
+            record["brand"] = rng.choice(brands)
+            record["price"] = round(template["price"] * rng.uniform(0.5, 2.0), -1)
+            record["moisture_resistant"] = rng.random() < 0.3
+            record["popularity"] = round(rng.random(), 3)
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Утилиты каталога товаров")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    gen = subparsers.add_parser("generate", help="Сгенерировать синтетический каталог товаров")
+    gen.add_argument("output")
+    gen.add_argument("--count", type=int, default=1_000_000)
+    gen.add_argument("--sample", default="products_sample.jsonl")
+    gen.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.sample, args.output, args.count, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+import logging
+import mmap
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import nullcontext
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Функции, в которых поток простаивает (ожидание задач, событий, сокетов);
+# такие выборки по умолчанию не попадают в профиль
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("connection.py", "_poll"),
+    ("connection.py", "accept"),
+}
+
+
+class ProfilingBusy(Exception):
+    """Профиль CPU уже снимается или профилирование выключено"""
+
+
+class Profiler:
+    """Профилирование по запросу: семплирование стеков и tracemalloc.
+
+    Пока профилирование выключено, ничего не запущено: нет ни потока
+    семплирования, ни трассировки выделений памяти. Состояние свое
+    у каждого воркера.
+    """
+
+    def __init__(self, enabled: bool = False, max_seconds: float = 60.0):
+        self.enabled = enabled
+        self.max_seconds = max_seconds
+        self._cpu_lock = threading.Lock()
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self.profiles_taken = 0
+
+    def set_enabled(self, enabled: bool):
+        self.enabled = enabled
+        if not enabled:
+            self.stop_tracemalloc()
+        logger.info(f"Профилирование {'включено' if enabled else 'выключено'}")
+
+    def state(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "cpu_profile_running": self._cpu_lock.locked(),
+            "profiles_taken": self.profiles_taken,
+            "tracemalloc": tracemalloc.is_tracing(),
+            "tracemalloc_frames": tracemalloc.get_traceback_limit() if tracemalloc.is_tracing() else None
+        }
+
+    def sample_cpu(self, seconds: float, interval: float = 0.005, include_idle: bool = False) -> str:
+        """Профиль CPU в формате collapsed stacks (flamegraph.pl, speedscope).
+
+        Стеки всех потоков, кроме текущего, снимаются через sys._current_frames
+        каждые interval секунд; строка результата - "поток;кадр;...;кадр число".
+        """
+        if not self.enabled:
+            raise ProfilingBusy("Профилирование выключено")
+        if not self._cpu_lock.acquire(blocking=False):
+            raise ProfilingBusy("Профиль CPU уже снимается")
+
+        try:
+            stacks = Counter()
+            own_ident = threading.get_ident()
+            names = {}
+            end = time.monotonic() + min(seconds, self.max_seconds)
+            while time.monotonic() < end:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+                    stack = _collapse(frame, include_idle)
+                    if stack is None:
+                        continue
+                    if ident not in names:
+                        names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    stacks[(names.get(ident, str(ident)), stack)] += 1
+                time.sleep(interval)
+            self.profiles_taken += 1
+        finally:
+            self._cpu_lock.release()
+
+        return "".join(f"{thread};{stack} {count}\n" for (thread, stack), count in stacks.most_common())
+
+    def start_tracemalloc(self, frames: int = 10):
+        """Запуск трассировки выделений; текущий снимок становится базовым"""
+        if not self.enabled:
+            raise ProfilingBusy("Профилирование выключено")
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = _snapshot()
+
+    def stop_tracemalloc(self):
+        self._baseline = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def tracemalloc_diff(self, top: int = 20, reset: bool = False) -> Optional[Dict]:
+        """Разница с базовым снимком по строкам кода; None, если трассировка выключена"""
+        if not tracemalloc.is_tracing() or self._baseline is None:
+            return None
+
+        current = _snapshot()
+        diff = current.compare_to(self._baseline, "lineno")
+        traced, peak = tracemalloc.get_traced_memory()
+        if reset:
+            self._baseline = current
+
+        return {
+            "traced_mb": round(traced / 2 ** 20, 3),
+            "peak_mb": round(peak / 2 ** 20, 3),
+            "top": [
+                {
+                    "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    "size_kb": round(stat.size / 1024, 1),
+                    "size_diff_kb": round(stat.size_diff / 1024, 1),
+                    "count": stat.count,
+                    "count_diff": stat.count_diff
+                }
+                for stat in diff[:top]
+            ]
+        }
+
+
+def _collapse(frame, include_idle: bool) -> Optional[str]:
+    code = frame.f_code
+    if not include_idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+        return None
+
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(name.replace(";", ":") for name in reversed(names))
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def _is_mapped(array: np.ndarray) -> bool:
+    """Массив лежит в отображенном в память файле (общий для воркеров)"""
+    while isinstance(array, np.ndarray):
+        if isinstance(array, np.memmap):
+            return True
+        array = array.base
+    return isinstance(array, mmap.mmap)
+
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> Tuple[int, int]:
+    """Оценка памяти объекта с вложенными: (байт в куче процесса, байт в mmap).
+
+    Обходит контейнеры и атрибуты (__dict__ и __slots__); для массивов numpy
+    берется nbytes, массивы из mmap учитываются отдельно.
+    """
+    seen = set() if seen is None else seen
+    private = mapped = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, (type, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(item))
+
+        if isinstance(item, np.ndarray):
+            if _is_mapped(item):
+                mapped += item.nbytes
+                continue
+            # Представление учитывается через исходный массив
+            while isinstance(item.base, np.ndarray):
+                item = item.base
+            if ("array", id(item)) not in seen:
+                seen.add(("array", id(item)))
+                private += item.nbytes
+            continue
+
+        private += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif not isinstance(item, (str, bytes, int, float, bool)):
+            if hasattr(item, "__dict__"):
+                stack.append(vars(item))
+            for cls in type(item).__mro__:
+                for slot in getattr(cls, "__slots__", ()):
+                    if hasattr(item, slot):
+                        stack.append(getattr(item, slot))
+    return private, mapped
+
+
+def module_bytes(module) -> int:
+    """Веса и буферы модели torch"""
+    return sum(t.numel() * t.element_size() for t in list(module.parameters()) + list(module.buffers()))
+
+
+def process_rss() -> Optional[int]:
+    """Текущий RSS процесса в байтах (Linux); иначе пиковый из getrusage"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # На macOS ru_maxrss в байтах, на Linux - в килобайтах
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def memory_breakdown(engine) -> Dict:
+    """Память движка по компонентам, МБ: модель, эмбеддинги, индексы, кэши"""
+    index = engine.category_vectors
+    components = {
+        "embedding_matrix": index.vectors,
+        "vector_index": (index.owners, index.weights, index.offsets, index._weight_sums),
+        "lexical_index": (engine.lexical_entries, engine.result_fragments),
+        "suggest_index": engine.suggest_index,
+        "product_store": engine.product_store,
+        # Кэши меняются из других потоков - обходим копию, снятую под блокировкой
+        "result_cache": engine.result_cache.snapshot(),
+        "embedding_cache": engine.embedding_cache.snapshot(),
+    }
+
+    # Префиксное дерево пополняется запросами - обходим его под его блокировкой
+    locks = {"suggest_index": engine.suggest_index._lock}
+
+    # При нескольких воркерах веса модели открыты через mmap (serving.share_model_weights)
+    weights = module_bytes(engine.model)
+    shared_weights = sum(array.nbytes for array in getattr(engine.model, "shared_weight_arrays", ()))
+
+    seen = set()
+    breakdown = {"model_weights": {
+        "heap_mb": round(max(weights - shared_weights, 0) / 2 ** 20, 3),
+        "mmap_mb": round(shared_weights / 2 ** 20, 3)
+    }}
+    for name, obj in components.items():
+        with locks.get(name, nullcontext()):
+            private, mapped = deep_sizeof(obj, seen)
+        breakdown[name] = {"heap_mb": round(private / 2 ** 20, 3), "mmap_mb": round(mapped / 2 ** 20, 3)}
+
+    rss = process_rss()
+    return {
+        "rss_mb": round(rss / 2 ** 20, 3) if rss is not None else None,
+        "components": breakdown
+    }
@@ -0,0 +1,50 @@
+import re
+from typing import Iterator, Optional, Tuple
+
+# Строка лога поиска: Поиск: 'запрос' (threshold=0.6, limit=10[, stream])
+_QUERY_LOG_PATTERN = re.compile(r"Поиск: '(.+)' \(threshold=([^,]+), limit=([^,)]+)")
+# Завершение поиска: Поиск завершен за 0.012с, найдено 3 результатов: 'запрос'
+_RESULT_LOG_PATTERN = re.compile(r"Поиск завершен за [^,]+, найдено (\d+) результатов: '(.*)'$")
+
+
+def _parse_number(value: str, cast, default):
+    """Число из лога; "None" - параметр не задан (None), нечитаемое значение - default"""
+    if value == "None":
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+
+def read_query_log(log_path: str = "search_logs.log", default_threshold: Optional[float] = None,
+                   default_limit: Optional[int] = None) -> Iterator[Tuple[str, Optional[float], Optional[int]]]:
+    """Запросы из лога поиска: (запрос, threshold, limit); пустой итератор, если лога нет.
+
+    Записанные в лог None сохраняются (limit=None - все результаты), значения
+    по умолчанию подставляются только вместо нечитаемых полей.
+    """
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                match = _QUERY_LOG_PATTERN.search(line)
+                if match:
+                    yield (
+                        match.group(1),
+                        _parse_number(match.group(2), float, default_threshold),
+                        _parse_number(match.group(3), int, default_limit)
+                    )
+    except FileNotFoundError:
+        return
+
+
+def read_successful_queries(log_path: str = "search_logs.log") -> Iterator[str]:
+    """Запросы из лога, по которым что-то нашлось (то же правило, что и при работе)"""
+    try:
+        with open(log_path, "r", encoding="utf-8") as f:
+            for line in f:
+                match = _RESULT_LOG_PATTERN.search(line.rstrip("\n"))
+                if match and int(match.group(1)) > 0:
+                    yield match.group(2)
+    except FileNotFoundError:
+        return
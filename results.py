@@ -0,0 +1,72 @@
+import heapq
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен, стандартный json дает тот же результат медленнее
+    orjson = None
+
+
+def dumps(value) -> bytes:
+    """Сериализация в JSON-байты (orjson, если установлен)"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class ResultRecord:
+    """Легкая запись результата: id категории в flat_categories, скор и метод"""
+    __slots__ = ("category_id", "score", "method")
+
+    def __init__(self, category_id: int, score: float, method: str):
+        self.category_id = category_id
+        self.score = score
+        self.method = method
+
+
+def top_k(candidates: Iterable[Tuple[int, float, str]], limit: Optional[int]) -> List[ResultRecord]:
+    """Дедупликация по id (первое вхождение побеждает) и частичный отбор top-k.
+
+    Порядок совпадает с сортировкой по (-score, method != "exact") с
+    сохранением порядка поступления при равенстве.
+    """
+    best: Dict[int, Tuple[float, str]] = {}
+    for category_id, score, method in candidates:
+        if category_id not in best:
+            best[category_id] = (score, method)
+
+    # limit=None - все результаты, как и срез [:None]
+    top = heapq.nsmallest(len(best) if limit is None else limit, best.items(), key=lambda item: (-item[1][0], item[1][1] != "exact"))
+    return [ResultRecord(category_id, score, method) for category_id, (score, method) in top]
+
+
+def build_fragments(category_mapping: Dict[str, Dict]) -> List[bytes]:
+    """Заранее сериализованные поля category/subcategory для каждой категории"""
+    return [
+        b'{"category":' + dumps(mapping["category_name"])
+        + b',"subcategory":' + dumps(mapping["subcategory_name"])
+        for mapping in category_mapping.values()
+    ]
+
+
+def render_results(records: List[ResultRecord], fragments: List[bytes]) -> bytes:
+    """JSON-массив результатов из готовых фрагментов без pydantic-валидации"""
+    return b"[" + b",".join(
+        fragments[r.category_id]
+        + b',"score":' + repr(float(r.score)).encode()
+        + b',"method":"' + r.method.encode() + b'"}'
+        for r in records
+    ) + b"]"
+
+
+def render_search_response(query: str, records: List[ResultRecord],
+                           fragments: List[bytes], processing_time: float) -> bytes:
+    """Тело ответа SearchResponse"""
+    return (
+        b'{"query":' + dumps(query)
+        + b',"results":' + render_results(records, fragments)
+        + b',"total":' + str(len(records)).encode()
+        + b',"processing_time":' + repr(processing_time).encode()
+        + b"}"
+    )
@@ -0,0 +1,192 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Параметры многопроцессного запуска (переменные окружения)
+WORKERS = int(os.getenv("SEARCH_WORKERS", "1"))
+# 0 - оставить значение torch по умолчанию (все ядра на процесс)
+INFERENCE_THREADS = int(os.getenv("SEARCH_INFERENCE_THREADS", "0"))
+SHARED_DIR = os.getenv("SEARCH_SHARED_DIR", "data")
+
+# Пул инференса: число потоков, глубина очереди, дедлайн по умолчанию и
+# поведение при перегрузке ("degrade" - только лексический поиск, "reject" - 503)
+INFERENCE_POOL_SIZE = int(os.getenv("SEARCH_INFERENCE_POOL_SIZE", "2"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("SEARCH_INFERENCE_QUEUE_SIZE", "32"))
+INFERENCE_DEADLINE_MS = int(os.getenv("SEARCH_INFERENCE_DEADLINE_MS", "2000"))
+OVERLOAD_POLICY = os.getenv("SEARCH_OVERLOAD_POLICY", "degrade")
+
+# Многовекторное представление категорий: пулинг ("max" или "mean"),
+# порог прунинга почти одинаковых векторов (0 - выключен) и
+# максимум векторов на категорию со сжатием до центроидов (0 - без ограничения)
+VECTOR_POOLING = os.getenv("SEARCH_VECTOR_POOLING", "max")
+VECTOR_PRUNE_THRESHOLD = float(os.getenv("SEARCH_VECTOR_PRUNE_THRESHOLD", "0"))
+VECTORS_PER_CATEGORY = int(os.getenv("SEARCH_VECTORS_PER_CATEGORY", "0"))
+
+# Elasticsearch: пул соединений, таймаут поискового запроса,
+# число ошибок подряд до размыкания цепи и период фоновой проверки
+ES_HOST = os.getenv("SEARCH_ES_HOST", "localhost")
+ES_PORT = int(os.getenv("SEARCH_ES_PORT", "9200"))
+ES_CONNECTIONS_PER_NODE = int(os.getenv("SEARCH_ES_CONNECTIONS_PER_NODE", "10"))
+ES_REQUEST_TIMEOUT_MS = int(os.getenv("SEARCH_ES_REQUEST_TIMEOUT_MS", "300"))
+ES_BREAKER_FAILURES = int(os.getenv("SEARCH_ES_BREAKER_FAILURES", "3"))
+ES_PROBE_INTERVAL_S = float(os.getenv("SEARCH_ES_PROBE_INTERVAL_S", "5"))
+
+# Кэши результатов и эмбеддингов запросов (число элементов, 0 - выключен)
+# и прогрев по самым частым запросам из лога при старте (0 - без прогрева)
+RESULT_CACHE_SIZE = int(os.getenv("SEARCH_RESULT_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("SEARCH_EMBEDDING_CACHE_SIZE", "10000"))
+WARMUP_QUERIES = int(os.getenv("SEARCH_WARMUP_QUERIES", "500"))
+WARMUP_BATCH_SIZE = int(os.getenv("SEARCH_WARMUP_BATCH_SIZE", "64"))
+
+# Шардирование каталога: адреса удаленных шардов "host:port,host:port"
+# или число локальных процессов-шардов (0 - без шардирования).
+# RPC шардов передает pickle, поэтому для удаленных шардов ключ обязателен;
+# локальным шардам без ключа выдается случайный (файл в SHARED_DIR)
+SHARDS = os.getenv("SEARCH_SHARDS", "")
+LOCAL_SHARDS = int(os.getenv("SEARCH_LOCAL_SHARDS", "0"))
+SHARD_BASE_PORT = int(os.getenv("SEARCH_SHARD_BASE_PORT", "7100"))
+SHARD_DEADLINE_MS = int(os.getenv("SEARCH_SHARD_DEADLINE_MS", "200"))
+SHARD_AUTHKEY = os.getenv("SEARCH_SHARD_AUTHKEY", "")
+
+# Подсказки: сколько раз запрос должен найти результаты, чтобы стать подсказкой,
+# и максимум подсказок из пользовательских запросов (ограничение памяти)
+SUGGEST_MIN_QUERY_COUNT = int(os.getenv("SEARCH_SUGGEST_MIN_QUERY_COUNT", "3"))
+SUGGEST_MAX_QUERY_TERMS = int(os.getenv("SEARCH_SUGGEST_MAX_QUERY_TERMS", "10000"))
+
+# Максимальная длина поискового запроса в символах (длиннее - 422)
+MAX_QUERY_LENGTH = int(os.getenv("SEARCH_MAX_QUERY_LENGTH", "256"))
+
+# Каталог товаров (SKU) в формате JSONL; если файла нет, поиск товаров недоступен
+PRODUCTS_PATH = os.getenv("SEARCH_PRODUCTS_PATH", "products_sample.jsonl")
+
+# Служебные эндпоинты /admin: токен в заголовке X-Admin-Token (пусто - эндпоинты скрыты)
+# и начальное состояние профилирования (включается и во время работы)
+ADMIN_TOKEN = os.getenv("SEARCH_ADMIN_TOKEN", "")
+PROFILING_ENABLED = os.getenv("SEARCH_PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+
+
+def configure_inference_threads():
+    """Ограничение потоков torch на воркер, чтобы N воркеров не делили ядра"""
+    if INFERENCE_THREADS <= 0:
+        return
+
+    import torch
+
+    torch.set_num_threads(INFERENCE_THREADS)
+    logger.info(f"Потоков инференса на воркер: {INFERENCE_THREADS}")
+
+
+def share_model_weights(model, shared_catalog: "SharedCatalog") -> List[np.ndarray]:
+    """Перевести веса модели на mmap-массивы в SHARED_DIR.
+
+    Первый воркер под блокировкой сохраняет state_dict модели, все воркеры
+    (включая его) подменяют параметры и буферы тензорами поверх mmap -
+    в устойчивом состоянии страницы весов общие через page cache, а частная
+    копия, прочитанная SentenceTransformer, освобождается. Возвращает массивы
+    (по ним профилировщик учитывает веса как mmap).
+    """
+    import warnings
+
+    import torch
+
+    state = model.state_dict()
+    names = list(state)
+    with shared_catalog.leader_lock():
+        arrays = [shared_catalog.load_array(f"model_{name}") for name in names]
+        # Набор неполон, если предыдущий лидер упал посреди записи - сохраняем заново
+        if any(array is None for array in arrays):
+            arrays = [
+                shared_catalog.save_array(f"model_{name}", state[name].detach().cpu().numpy())
+                for name in names
+            ]
+            logger.info(f"Веса модели сохранены в {shared_catalog.shared_dir}: {len(names)} тензоров")
+
+    with warnings.catch_warnings():
+        # Массивы только для чтения: torch предупреждает, но инференс веса не изменяет
+        warnings.simplefilter("ignore", UserWarning)
+        shared_state = {name: torch.from_numpy(array) for name, array in zip(names, arrays)}
+    model.load_state_dict(shared_state, assign=True)
+    logger.info("Веса модели открыты через mmap")
+    return arrays
+
+
+def catalog_fingerprint(flat_categories: List[str], model_name: str) -> str:
+    """Отпечаток каталога и модели для проверки актуальности общих артефактов"""
+    digest = hashlib.sha256(model_name.encode("utf-8"))
+    for name in flat_categories:
+        digest.update(b"\0" + name.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class SharedCatalog:
+    """Общие для воркеров артефакты каталога в SHARED_DIR.
+
+    Массивы (эмбеддинги и т.п.) строит один процесс (лидер под файловой
+    блокировкой), остальные открывают их через mmap - страницы делятся
+    через page cache ОС.
+    """
+
+    def __init__(self, fingerprint: str, shared_dir: str = SHARED_DIR):
+        self.fingerprint = fingerprint
+        self.shared_dir = shared_dir
+        os.makedirs(shared_dir, exist_ok=True)
+        self.marker_path = os.path.join(shared_dir, "catalog_state.json")
+        self.lock_path = os.path.join(shared_dir, "catalog.lock")
+
+    @contextmanager
+    def leader_lock(self):
+        """Эксклюзивная блокировка: первый воркер строит, остальные ждут и переиспользуют"""
+        with open(self.lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def array_path(self, name: str) -> str:
+        return os.path.join(self.shared_dir, f"{name}_{self.fingerprint}.npy")
+
+    def load_array(self, name: str) -> Optional[np.ndarray]:
+        """Открыть готовый массив через mmap (только чтение)"""
+        path = self.array_path(name)
+        if not os.path.exists(path):
+            return None
+        logger.info(f"Массив {name} загружен из {path} (mmap)")
+        return np.load(path, mmap_mode="r")
+
+    def save_array(self, name: str, array: np.ndarray) -> np.ndarray:
+        """Атомарно сохранить массив и вернуть его mmap-представление"""
+        path = self.array_path(name)
+        tmp_path = path + ".tmp.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, path)
+        return np.load(path, mmap_mode="r")
+
+    def es_indexed(self) -> bool:
+        """Построен ли индекс Elasticsearch для текущего каталога"""
+        state = self._read_state()
+        return state.get("fingerprint") == self.fingerprint and state.get("es_indexed", False)
+
+    def mark_es_indexed(self):
+        self._write_state(es_indexed=True)
+
+    def _read_state(self) -> dict:
+        try:
+            with open(self.marker_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_state(self, es_indexed: bool):
+        tmp_path = self.marker_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "es_indexed": es_indexed}, f)
+        os.replace(tmp_path, self.marker_path)
@@ -0,0 +1,442 @@
+import argparse
+import json
+import logging
+import os
+import secrets
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from multiprocessing.connection import Connection, Listener, answer_challenge, deliver_challenge
+from queue import Empty, Queue
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import serving
+from matching import match_exact_and_synonyms, merge_top, rank_key, select_semantic
+from multivector import MultiVectorIndex
+
+logger = logging.getLogger(__name__)
+
+# Ответ _safe_call при ошибке шарда (None - истек дедлайн)
+_FAILED = object()
+
+
+class CatalogShard:
+    """Часть каталога: свои векторы категорий и лексический индекс, глобальные id категорий.
+
+    fingerprint - отпечаток каталога, из которого выгружен шард; роутер
+    сверяет его со своим при старте.
+    """
+
+    def __init__(self, category_ids: np.ndarray, entries: List[Tuple[int, str, List[str]]],
+                 vectors: np.ndarray, owners: np.ndarray, weights: np.ndarray, pooling: str = "max",
+                 fingerprint: Optional[str] = None):
+        self.fingerprint = fingerprint
+        self.category_ids = category_ids
+        self.entries = entries
+        self.vector_index = MultiVectorIndex(vectors, owners, weights, pooling=pooling)
+
+    @classmethod
+    def load(cls, prefix: str, pooling: str = "max") -> "CatalogShard":
+        """Загрузка шарда, выгруженного export_shards (массивы через mmap)"""
+        with open(f"{prefix}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        entries = [tuple(entry) for entry in meta["entries"]]
+        arrays = {
+            name: np.load(f"{prefix}_{name}.npy", mmap_mode="r")
+            for name in ("category_ids", "vectors", "owners", "weights")
+        }
+        return cls(arrays["category_ids"], entries, arrays["vectors"], arrays["owners"], arrays["weights"], pooling,
+                   fingerprint=meta.get("fingerprint"))
+
+    def search_lexical(self, query: str, limit: int) -> List[Tuple[int, float, str]]:
+        return sorted(match_exact_and_synonyms(query, self.entries), key=rank_key)[:limit]
+
+    def search_semantic(self, query_vector: np.ndarray, threshold: float, limit: int) -> List[Tuple[int, float, str]]:
+        return select_semantic(self.vector_index.score(query_vector), threshold, self.category_ids, limit)
+
+    def handle(self, request: Dict):
+        op = request["op"]
+        if op == "lexical":
+            return self.search_lexical(request["query"], request["limit"])
+        if op == "semantic":
+            return self.search_semantic(request["vector"], request["threshold"], request["limit"])
+        if op == "ping":
+            return {"fingerprint": self.fingerprint, "category_ids": [int(i) for i in self.category_ids]}
+        raise ValueError(f"Неизвестная операция шарда: {op}")
+
+
+def export_shards(engine, n_shards: int, directory: str) -> List[str]:
+    """Разбиение каталога движка на n_shards частей (по id категории по модулю)"""
+    index = engine.category_vectors
+    validate_shard_count(n_shards, index.n_categories)
+    os.makedirs(directory, exist_ok=True)
+    owners = np.asarray(index.owners)
+    prefixes = []
+
+    for shard in range(n_shards):
+        category_ids = np.arange(shard, index.n_categories, n_shards, dtype=np.int32)
+        rows = np.flatnonzero(np.isin(owners, category_ids))
+        # Локальные номера категорий шарда для пулинга по сегментам
+        local_owners = np.searchsorted(category_ids, owners[rows]).astype(np.int32)
+
+        prefix = os.path.join(directory, f"shard_{shard}_of_{n_shards}")
+        np.save(f"{prefix}_category_ids.npy", category_ids)
+        np.save(f"{prefix}_vectors.npy", np.asarray(index.vectors[rows]))
+        np.save(f"{prefix}_owners.npy", local_owners)
+        np.save(f"{prefix}_weights.npy", np.asarray(index.weights[rows]))
+        with open(f"{prefix}.json", "w", encoding="utf-8") as f:
+            entries = [engine.lexical_entries[i] for i in category_ids]
+            json.dump({"fingerprint": engine.shared_catalog.fingerprint, "entries": entries}, f, ensure_ascii=False)
+        prefixes.append(prefix)
+
+    logger.info(f"Каталог разбит на {n_shards} шардов в {directory}")
+    return prefixes
+
+
+def validate_shard_count(n_shards: int, n_categories: int):
+    """Каждому шарду нужна хотя бы одна категория (пустой шард не построит индекс)"""
+    if not 1 <= n_shards <= n_categories:
+        raise ValueError(f"Число шардов должно быть от 1 до {n_categories} (число категорий), задано {n_shards}")
+
+
+def _exit_with(pid: int, interval: float = 1.0):
+    """Завершить процесс шарда, когда процесс pid завершится"""
+    while True:
+        time.sleep(interval)
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            logger.info(f"Процесс {pid} завершен, останавливаем шард")
+            os._exit(0)
+        except PermissionError:
+            pass
+
+
+def serve_shard(prefix: str, host: str, port: int, authkey: bytes, pooling: str = "max",
+                parent_pid: Optional[int] = None):
+    """RPC-сервер шарда: запрос и ответ - pickle через multiprocessing.connection.
+
+    parent_pid - процесс, вместе с которым шард завершается (для локальных шардов).
+    """
+    shard = CatalogShard.load(prefix, pooling)
+    if parent_pid:
+        threading.Thread(target=_exit_with, args=(parent_pid,), name="parent-watch", daemon=True).start()
+    listener = Listener((host, port), authkey=authkey)
+    logger.info(f"Шард {prefix} слушает {host}:{port} ({len(shard.category_ids)} категорий)")
+
+    def handle_connection(conn):
+        with conn:
+            while True:
+                try:
+                    request = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(("ok", shard.handle(request)))
+                except Exception as e:
+                    conn.send(("error", str(e)))
+
+    while True:
+        conn = listener.accept()
+        threading.Thread(target=handle_connection, args=(conn,), daemon=True).start()
+
+
+def require_authkey() -> bytes:
+    """Явно заданный ключ RPC; без него удаленный шард или роутер не запускается"""
+    if not serving.SHARD_AUTHKEY:
+        raise RuntimeError(
+            "SEARCH_SHARD_AUTHKEY не задан: RPC шардов передает pickle, "
+            "без секретного ключа любой, кто достучится до порта, выполнит код на шарде"
+        )
+    return serving.SHARD_AUTHKEY.encode("utf-8")
+
+
+def local_authkey(directory: str) -> bytes:
+    """Ключ локальных шардов: заданный явно или случайный, общий для воркеров через файл"""
+    if serving.SHARD_AUTHKEY:
+        return serving.SHARD_AUTHKEY.encode("utf-8")
+
+    path = os.path.join(directory, "shard_authkey")
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            return f.read()
+    key = secrets.token_hex(32).encode("ascii")
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def _set_io_timeout(sock: socket.socket, timeout: float):
+    """Таймаут чтения и записи на уровне ОС (0 - без таймаута) для блокирующего сокета"""
+    seconds = int(timeout)
+    timeval = struct.pack("ll", seconds, int((timeout - seconds) * 1_000_000))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVTIMEO, timeval)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, timeval)
+
+
+def _connect(address: Tuple[str, int], authkey: bytes, timeout: float) -> Connection:
+    """multiprocessing.connection.Client с таймаутом на соединение и рукопожатие.
+
+    Шард, который принимает соединение, но не отвечает, не должен занимать
+    поток роутера дольше дедлайна: на время проверки ключа сокету ставится
+    таймаут ОС на оставшееся время, затем он снимается (ответы ждутся через poll).
+    """
+    deadline = time.monotonic() + timeout
+    sock = socket.create_connection(address, timeout=max(timeout, 0.001))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Connection работает с блокирующим дескриптором
+    sock.setblocking(True)
+    _set_io_timeout(sock, max(deadline - time.monotonic(), 0.001))
+
+    conn = Connection(sock.detach())
+    try:
+        answer_challenge(conn, authkey)
+        deliver_challenge(conn, authkey)
+    except BlockingIOError:
+        # SO_RCVTIMEO/SO_SNDTIMEO истек - шард не ответил на рукопожатие
+        conn.close()
+        raise socket.timeout(f"Шард {address} не ответил на рукопожатие")
+    except BaseException:
+        conn.close()
+        raise
+
+    with socket.fromfd(conn.fileno(), socket.AF_INET, socket.SOCK_STREAM) as handshake_sock:
+        _set_io_timeout(handshake_sock, 0)
+    return conn
+
+
+def _parse_address(address: str) -> Tuple[str, int]:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class ShardRouter:
+    """Параллельная рассылка запроса по шардам и слияние top-k.
+
+    Дедлайн отсчитывается от начала рассылки и покрывает ожидание в пуле
+    потоков, установку соединения и ответ. Шард, не ответивший до дедлайна,
+    пропускается (ответ помечается как частичный в метриках), его соединение
+    закрывается.
+    """
+
+    def __init__(self, addresses: List[Tuple[str, int]], authkey: bytes,
+                 deadline: float = 0.2, connections_per_shard: int = 4):
+        self.addresses = addresses
+        self.authkey = authkey
+        self.deadline = deadline
+        self._pools = [Queue() for _ in addresses]
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(addresses) * connections_per_shard, thread_name_prefix="shard-router"
+        )
+        self._processes: List[subprocess.Popen] = []
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.partial = 0
+        self.shard_timeouts = [0] * len(addresses)
+        self.shard_errors = [0] * len(addresses)
+
+    @classmethod
+    def from_env(cls, engine) -> Optional["ShardRouter"]:
+        """Удаленные шарды из SEARCH_SHARDS или локальные процессы из SEARCH_LOCAL_SHARDS"""
+        deadline = serving.SHARD_DEADLINE_MS / 1000.0
+
+        if serving.SHARDS:
+            addresses = [_parse_address(a.strip()) for a in serving.SHARDS.split(",") if a.strip()]
+            router = cls(addresses, require_authkey(), deadline)
+            router.verify(engine.shared_catalog.fingerprint, engine.category_vectors.n_categories)
+            return router
+
+        if serving.LOCAL_SHARDS > 0:
+            validate_shard_count(serving.LOCAL_SHARDS, engine.category_vectors.n_categories)
+            addresses = [("127.0.0.1", serving.SHARD_BASE_PORT + i) for i in range(serving.LOCAL_SHARDS)]
+            directory = os.path.join(serving.SHARED_DIR, f"shards_{engine.shared_catalog.fingerprint}")
+            # Шарды запускает один воркер; остальные подключаются к уже запущенным
+            with engine.shared_catalog.leader_lock():
+                os.makedirs(directory, exist_ok=True)
+                router = cls(addresses, local_authkey(directory), deadline)
+                if not router.ping_all():
+                    prefixes = export_shards(engine, serving.LOCAL_SHARDS, directory)
+                    # Шарды общие для всех воркеров, поэтому живут, пока жив мастер uvicorn,
+                    # а не запустивший их воркер (его могут перезапустить)
+                    router.start_local(prefixes, os.getppid() if serving.WORKERS > 1 else os.getpid())
+                router.verify(engine.shared_catalog.fingerprint, engine.category_vectors.n_categories)
+            return router
+
+        return None
+
+    def start_local(self, prefixes: List[str], parent_pid: int, startup_timeout: float = 30.0):
+        """Запуск шардов локальными процессами (тот же CLI, что и для удаленного узла).
+
+        Шарды завершаются сами вместе с процессом parent_pid.
+        """
+        for prefix, (host, port) in zip(prefixes, self.addresses):
+            self._processes.append(subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "serve", prefix, "--host", host, "--port", str(port),
+                 "--parent-pid", str(parent_pid)],
+                env={**os.environ, "SEARCH_SHARD_AUTHKEY": self.authkey.decode("utf-8")}
+            ))
+
+        deadline = time.monotonic() + startup_timeout
+        while not self.ping_all():
+            if time.monotonic() > deadline:
+                raise RuntimeError("Локальные шарды не запустились")
+            time.sleep(0.1)
+        logger.info(f"Запущено локальных шардов: {len(prefixes)}")
+
+    def stop_local(self):
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.wait()
+        self._processes = []
+
+    def ping_all(self) -> bool:
+        try:
+            return all(self._call(i, {"op": "ping"}, time.monotonic() + self.deadline * 5) is not None
+                       for i in range(len(self.addresses)))
+        except (OSError, EOFError):
+            return False
+
+    def verify(self, fingerprint: str, n_categories: int):
+        """Проверка при старте: все шарды отвечают, выгружены из текущего каталога
+        и вместе покрывают каждую категорию ровно один раз. Иначе RuntimeError."""
+        covered = []
+        for shard, (host, port) in enumerate(self.addresses):
+            try:
+                info = self._call(shard, {"op": "ping"}, time.monotonic() + self.deadline * 5)
+            except (OSError, EOFError) as e:
+                raise RuntimeError(f"Шард {host}:{port} недоступен: {e}")
+            if info is None:
+                raise RuntimeError(f"Шард {host}:{port} не ответил")
+            if not isinstance(info, dict) or info.get("fingerprint") != fingerprint:
+                found = info.get("fingerprint") if isinstance(info, dict) else None
+                raise RuntimeError(
+                    f"Шард {host}:{port} выгружен из другого каталога (отпечаток {found}, нужен {fingerprint}); "
+                    f"выгрузите шарды заново: python3 sharding.py export"
+                )
+            covered.extend(info["category_ids"])
+
+        if sorted(covered) != list(range(n_categories)):
+            raise RuntimeError(f"Шарды не покрывают {n_categories} категорий каталога ровно один раз")
+        logger.info(f"Шарды проверены: {len(self.addresses)}, отпечаток каталога {fingerprint}")
+
+    def _call(self, shard: int, request: Dict, deadline: float):
+        """Запрос к шарду; deadline - момент time.monotonic(), после которого ответ не нужен"""
+        if time.monotonic() >= deadline:
+            # Задача простояла в очереди пула до дедлайна - шард даже не опрашиваем
+            return None
+        try:
+            conn = self._pools[shard].get_nowait()
+        except Empty:
+            conn = _connect(self.addresses[shard], self.authkey, deadline - time.monotonic())
+
+        conn.send(request)
+        if not conn.poll(max(deadline - time.monotonic(), 0)):
+            # Ответ придет позже - соединение больше нельзя переиспользовать
+            conn.close()
+            return None
+
+        status, payload = conn.recv()
+        self._pools[shard].put(conn)
+        if status != "ok":
+            raise RuntimeError(payload)
+        return payload
+
+    def _safe_call(self, shard: int, request: Dict, deadline: float):
+        try:
+            return self._call(shard, request, deadline)
+        except socket.timeout:
+            return None
+        except Exception as e:
+            with self._lock:
+                self.shard_errors[shard] += 1
+            logger.warning(f"Ошибка шарда {self.addresses[shard]}: {e}")
+            return _FAILED
+
+    def scatter(self, request: Dict, limit: int) -> List[Tuple[int, float, str]]:
+        """Рассылка по всем шардам с общим дедлайном и слияние их top-k"""
+        deadline = time.monotonic() + self.deadline
+        futures = [
+            self._executor.submit(self._safe_call, shard, request, deadline)
+            for shard in range(len(self.addresses))
+        ]
+        wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        # Незавершенные задачи дорабатывают в фоне, их ответы не нужны
+        responses = [future.result() if future.done() else None for future in futures]
+
+        with self._lock:
+            for shard, response in enumerate(responses):
+                if response is None:
+                    self.shard_timeouts[shard] += 1
+            self.requests += 1
+            if any(response is None or response is _FAILED for response in responses):
+                self.partial += 1
+        return merge_top([response for response in responses if response is not None and response is not _FAILED],
+                         limit)
+
+    def search_lexical(self, query: str, limit: int) -> List[Tuple[int, float, str]]:
+        return self.scatter({"op": "lexical", "query": query, "limit": limit}, limit)
+
+    def search_semantic(self, query_vector: np.ndarray, threshold: float, limit: int) -> List[Tuple[int, float, str]]:
+        request = {"op": "semantic", "vector": np.asarray(query_vector, dtype=np.float32),
+                   "threshold": threshold, "limit": limit}
+        return self.scatter(request, limit)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "shards": [f"{host}:{port}" for host, port in self.addresses],
+                "requests": self.requests,
+                "partial_responses": self.partial,
+                "shard_timeouts": list(self.shard_timeouts),
+                "shard_errors": list(self.shard_errors)
+            }
+
+
+def export_from_env(n_shards: int, directory: Optional[str] = None) -> List[str]:
+    """Выгрузка шардов текущего каталога (движок строится с текущими SEARCH_*)"""
+    # Сам движок при выгрузке шарды не использует
+    os.environ["SEARCH_SHARDS"] = ""
+    os.environ["SEARCH_LOCAL_SHARDS"] = "0"
+    from main import search_engine as engine
+
+    directory = directory or os.path.join(serving.SHARED_DIR, f"shards_{engine.shared_catalog.fingerprint}")
+    return export_shards(engine, n_shards, directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Шарды каталога: выгрузка и сервер")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export = subparsers.add_parser("export", help="Выгрузить шарды текущего каталога")
+    export.add_argument("--shards", type=int, required=True, help="Число шардов")
+    export.add_argument("--output", help="Каталог файлов шардов (по умолчанию data/shards_<отпечаток>)")
+    serve = subparsers.add_parser("serve", help="Запустить шард из файлов export_shards")
+    serve.add_argument("prefix", help="Префикс файлов шарда, например data/shards_x/shard_0_of_2")
+    serve.add_argument("--host", default="127.0.0.1", help="Адрес прослушивания (0.0.0.0 - все интерфейсы)")
+    serve.add_argument("--port", type=int, default=serving.SHARD_BASE_PORT)
+    serve.add_argument("--parent-pid", type=int, help="Завершиться вместе с этим процессом")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == "export":
+        for prefix in export_from_env(args.shards, args.output):
+            print(prefix)
+        return
+
+    try:
+        authkey = require_authkey()
+    except RuntimeError as e:
+        parser.error(str(e))
+    serve_shard(args.prefix, args.host, args.port, authkey, serving.VECTOR_POOLING, args.parent_pid)
+
+
+if __name__ == "__main__":
+    main()
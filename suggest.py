@@ -0,0 +1,214 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from query_log import read_successful_queries
+
+logger = logging.getLogger(__name__)
+
+# Веса источников подсказок: название подкатегории важнее синонима,
+# а каждый успешный пользовательский запрос добавляет QUERY_WEIGHT
+NAME_WEIGHT = 3.0
+SYNONYM_WEIGHT = 1.0
+QUERY_WEIGHT = 1.0
+# Более длинные запросы в подсказки не попадают
+MAX_QUERY_LENGTH = 64
+# Подсказок на префикс хранится (и отдается) не больше
+DEFAULT_TOP_K = 10
+
+
+def normalize(text: str) -> str:
+    """Нормализация строки для префиксного индекса"""
+    return " ".join(text.lower().replace("ё", "е").split())
+
+
+class _Node:
+    __slots__ = ("edges", "term_id", "top")
+
+    def __init__(self):
+        # Первый символ ребра -> (метка ребра, дочерний узел)
+        self.edges: Dict[str, tuple] = {}
+        self.term_id: Optional[int] = None
+        # Лучшие по весу термины поддерева (id), отсортированы по убыванию веса
+        self.top: List[int] = []
+
+
+class SuggestIndex:
+    """Сжатое префиксное дерево (radix trie) для подсказок при вводе.
+
+    Каждый узел хранит заранее посчитанный топ-K терминов своего поддерева,
+    поэтому ответ на запрос - это проход по префиксу без обхода поддерева.
+    Пользовательский запрос становится термином после min_query_count успешных
+    поисков; до этого он лежит в ограниченном LRU кандидатов. Терминов из
+    запросов не больше max_query_terms.
+    """
+
+    def __init__(self, top_k: int = DEFAULT_TOP_K, min_query_count: int = 3, max_query_terms: int = 10000):
+        self.top_k = top_k
+        self.min_query_count = max(min_query_count, 1)
+        self.max_query_terms = max_query_terms
+        self.query_terms = 0
+        self._candidates: "OrderedDict[str, int]" = OrderedDict()
+        self.root = _Node()
+        self.terms: List[str] = []
+        self.weights: List[float] = []
+        self.payloads: List[Dict] = []
+        self.term_ids: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @classmethod
+    def from_categories(cls, category_mapping: Dict[str, Dict], top_k: int = DEFAULT_TOP_K,
+                        min_query_count: int = 3, max_query_terms: int = 10000) -> "SuggestIndex":
+        """Построение индекса по названиям подкатегорий и синонимам"""
+        index = cls(top_k=top_k, min_query_count=min_query_count, max_query_terms=max_query_terms)
+        for full_name, mapping in category_mapping.items():
+            payload = {
+                "category": mapping["category_name"],
+                "subcategory": mapping["subcategory_name"]
+            }
+            index.add(mapping["subcategory_name"], NAME_WEIGHT, payload)
+            for synonym in mapping["synonyms"]:
+                index.add(synonym, SYNONYM_WEIGHT, payload)
+        return index
+
+    def add(self, text: str, weight: float, payload: Optional[Dict] = None):
+        """Добавить термин или увеличить его вес"""
+        key = normalize(text)
+        if not key:
+            return
+
+        with self._lock:
+            self._add(key, text, weight, payload)
+
+    def _add(self, key: str, text: str, weight: float, payload: Optional[Dict]):
+        term_id = self.term_ids.get(key)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.terms.append(text.strip())
+            self.weights.append(weight)
+            self.payloads.append(payload or {})
+            self.term_ids[key] = term_id
+            path = self._insert(key, term_id)
+        else:
+            self.weights[term_id] += weight
+            if payload and not self.payloads[term_id]:
+                self.payloads[term_id] = payload
+            path = self._path(key)
+
+        for node in path:
+            self._update_top(node, term_id)
+
+    def record_query(self, query: str):
+        """Учесть успешный пользовательский запрос в весах популярности"""
+        key = normalize(query)
+        if not key or len(key) > MAX_QUERY_LENGTH:
+            return
+
+        with self._lock:
+            if key in self.term_ids:
+                self._add(key, query, QUERY_WEIGHT, None)
+                return
+            if self.query_terms >= self.max_query_terms:
+                return
+
+            count = self._candidates.pop(key, 0) + 1
+            if count < self.min_query_count:
+                self._candidates[key] = count
+                while len(self._candidates) > self.max_query_terms:
+                    self._candidates.popitem(last=False)
+                return
+
+            self.query_terms += 1
+            self._add(key, query, QUERY_WEIGHT * count, None)
+
+    def load_query_log(self, log_path: str = "search_logs.log") -> int:
+        """Загрузить популярность успешных запросов из лога поиска"""
+        loaded = 0
+        for query in read_successful_queries(log_path):
+            self.record_query(query)
+            loaded += 1
+
+        logger.info(f"Загружено {loaded} запросов из лога для подсказок")
+        return loaded
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict]:
+        """Подсказки по префиксу, отсортированные по весу"""
+        key = normalize(prefix)
+        if not key:
+            return []
+
+        node = self.root
+        i = 0
+        while i < len(key):
+            edge = node.edges.get(key[i])
+            if edge is None:
+                return []
+            label, child = edge
+            rest = key[i:i + len(label)]
+            if not label.startswith(rest):
+                return []
+            node = child
+            i += len(label)
+
+        return [
+            {"text": self.terms[term_id], "weight": self.weights[term_id], **self.payloads[term_id]}
+            for term_id in node.top[:limit]
+        ]
+
+    def _insert(self, key: str, term_id: int) -> List[_Node]:
+        """Вставка ключа в дерево; возвращает путь от корня до узла термина"""
+        node = self.root
+        path = [node]
+        i = 0
+        while i < len(key):
+            edge = node.edges.get(key[i])
+            if edge is None:
+                leaf = _Node()
+                node.edges[key[i]] = (key[i:], leaf)
+                node = leaf
+                path.append(node)
+                break
+
+            label, child = edge
+            common = 0
+            while common < len(label) and i + common < len(key) and label[common] == key[i + common]:
+                common += 1
+
+            if common < len(label):
+                # Разбиваем ребро: промежуточный узел наследует топ поддерева
+                middle = _Node()
+                middle.edges[label[common]] = (label[common:], child)
+                middle.top = list(child.top)
+                node.edges[key[i]] = (label[:common], middle)
+                child = middle
+
+            node = child
+            path.append(node)
+            i += common
+
+        node.term_id = term_id
+        return path
+
+    def _path(self, key: str) -> List[_Node]:
+        node = self.root
+        path = [node]
+        i = 0
+        while i < len(key):
+            label, node = node.edges[key[i]]
+            path.append(node)
+            i += len(label)
+        return path
+
+    def _update_top(self, node: _Node, term_id: int):
+        weights = self.weights
+        if term_id not in node.top and len(node.top) >= self.top_k \
+                and weights[node.top[-1]] >= weights[term_id]:
+            return
+        top = [t for t in node.top if t != term_id]
+        top.append(term_id)
+        top.sort(key=lambda t: -weights[t])
+        node.top = top[:self.top_k]
@@ -118,6 +118,103 @@ def test_search(query: str, expected_category: str = None, threshold: float = 0.
             print(f"   Ответ сервера: {response.text}")
         return False
 
+def test_search_stream(query: str):
+    """Тест потокового поиска (NDJSON)"""
+    print(f"\n🌊 Потоковый поиск: '{query}'")
+
+    start_time = time.time()
+    response = requests.post(f"{API_BASE_URL}/search/stream",
+                             json={"query": query, "limit": 5}, stream=True)
+
+    if response.status_code != 200:
+        print(f"❌ Ошибка потокового поиска: {response.status_code}")
+        return False
+
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            continue
+        chunk = json.loads(line)
+        elapsed = time.time() - start_time
+        if chunk['stage'] == 'done':
+            print(f"✅ Готово: {chunk['total']} результатов за {chunk['processing_time']:.3f}с")
+        else:
+            print(f"   {chunk['stage']}: {len(chunk.get('results', []))} результатов через {elapsed:.3f}с")
+
+    return True
+
+def test_product_search(query: str, expected_subcategory: str):
+    """Тест поиска товаров: фильтры, фасеты и top-k"""
+    print(f"\n🛒 Поиск товаров: '{query}'")
+
+    response = requests.post(f"{API_BASE_URL}/products/search", json={"query": query, "limit": 5})
+    if response.status_code == 404:
+        print("⚠️  Каталог товаров не загружен (SEARCH_PRODUCTS_PATH), тест пропущен")
+        return True
+    if response.status_code != 200:
+        print(f"❌ Ошибка поиска товаров: {response.status_code}")
+        return False
+
+    data = response.json()
+    facets = data['facets']
+    print(f"✅ Найдено товаров: {data['total']} (запрос: {data['processing_time'] * 1000:.1f}мс)")
+    print(f"   Бренды: {facets['brand']}")
+
+    checks = [
+        (data['total'] > 0 and any(p['subcategory'] == expected_subcategory for p in data['products']),
+         f"есть товары подкатегории '{expected_subcategory}'"),
+        (len(data['products']) <= 5, "соблюден limit"),
+        ([p['score'] for p in data['products']] == sorted((p['score'] for p in data['products']), reverse=True),
+         "товары отсортированы по скору"),
+        (sum(facets['brand'].values()) == data['total'], "сумма фасета брендов равна total"),
+        (sum(facets['moisture_resistant'].values()) == data['total'], "сумма фасета влагостойкости равна total"),
+        (sum(b['count'] for b in facets['price']) == data['total'], "сумма фасета цены равна total"),
+    ]
+
+    # Фильтры: бренд из фасета, влагостойкость и верхняя граница цены
+    brand = max(facets['brand'], key=facets['brand'].get) if facets['brand'] else None
+    price_max = max(p['price'] for p in data['products']) if data['products'] else 0
+    filtered = requests.post(f"{API_BASE_URL}/products/search", json={
+        "query": query, "limit": 50, "brands": [brand], "moisture_resistant": True, "price_max": price_max
+    }).json()
+    checks += [
+        (all(p['brand'] == brand and p['moisture_resistant'] and p['price'] <= price_max
+             for p in filtered['products']), "товары удовлетворяют фильтрам"),
+        (filtered['total'] == sum(b['count'] for b in filtered['facets']['price']),
+         "total с фильтрами равен сумме фасета цены"),
+        # Фасет бренда считается без фильтра по бренду: остальные бренды видны
+        (filtered['facets']['brand'].get(brand, 0) == filtered['total'], "фасет бренда без собственного фильтра"),
+    ]
+
+    passed = True
+    for ok, description in checks:
+        print(f"   {'✅' if ok else '❌'} {description}")
+        passed = passed and ok
+    return passed
+
+def test_suggest(prefix: str, expected: str = None):
+    """Тест подсказок при вводе"""
+    print(f"\n💡 Подсказки: '{prefix}'")
+
+    start_time = time.time()
+    response = requests.get(f"{API_BASE_URL}/suggest", params={"q": prefix, "limit": 5})
+    response_time = time.time() - start_time
+
+    if response.status_code == 200:
+        data = response.json()
+        texts = [s['text'] for s in data['suggestions']]
+        print(f"✅ Подсказок: {len(texts)} (запрос: {response_time * 1000:.1f}мс)")
+        print(f"   {', '.join(texts)}")
+
+        if expected:
+            if expected.lower() in [t.lower() for t in texts]:
+                print(f"   ✅ Ожидаемая подсказка '{expected}' найдена")
+            else:
+                print(f"   ⚠️  Ожидаемая подсказка '{expected}' не найдена")
+        return True
+    else:
+        print(f"❌ Ошибка подсказок: {response.status_code}")
+        return False
+
 def test_stats():
     """Тест статистики"""
     print("\n📊 Получение статистики...")
@@ -185,6 +282,10 @@ def main():
     test_root()
     test_categories()
     test_stats()
+    test_suggest("шпа", "Шпатлевка")
+    test_suggest("каф", "кафель")
+    test_search_stream("кафель")
+    test_product_search("кафель", "Плитка")
     
     print("\n" + "="*50)
     print("🔍 ТЕСТИРОВАНИЕ ПОИСКА")
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Проверка шардированного каталога на localhost: шарды запускаются локальными
+процессами, ответ роутера сравнивается с поиском по нешардированному индексу.
+Модель не нужна - векторы категорий синтетические.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import match_exact_and_synonyms, merge_top, rank_key, select_semantic
+from multivector import MultiVectorIndex
+from sharding import ShardRouter, export_shards
+
+N_CATEGORIES = 8
+N_SHARDS = 3
+BASE_PORT = int(os.getenv("SHARDING_TEST_BASE_PORT", "7300"))
+AUTHKEY = b"sharding-test-key"
+FINGERPRINT = "test-catalog"
+
+
+def build_engine(seed: int = 0):
+    """Минимальный движок для export_shards: векторный и лексический индексы"""
+    rng = np.random.default_rng(seed)
+    owners = np.repeat(np.arange(N_CATEGORIES), 3)
+    vectors = rng.normal(size=(len(owners), 32)).astype(np.float32)
+    index = MultiVectorIndex.build(vectors, owners, np.ones(len(owners)))
+    entries = [(i, f"категория {i}", [f"синоним {i}", "общий"]) for i in range(N_CATEGORIES)]
+    return types.SimpleNamespace(category_vectors=index, lexical_entries=entries,
+                                 shared_catalog=types.SimpleNamespace(fingerprint=FINGERPRINT))
+
+
+def start_router(engine, directory: str, parent_pid: int = None) -> ShardRouter:
+    prefixes = export_shards(engine, N_SHARDS, directory)
+    router = ShardRouter([("127.0.0.1", BASE_PORT + i) for i in range(N_SHARDS)], AUTHKEY, deadline=1.0)
+    router.start_local(prefixes, parent_pid or os.getpid())
+    return router
+
+
+def assert_same(sharded, unsharded):
+    assert [r[0] for r in sharded] == [r[0] for r in unsharded], (sharded, unsharded)
+    # Скоры шарда и общего индекса могут отличаться в последнем знаке float32
+    assert np.allclose([r[1] for r in sharded], [r[1] for r in unsharded], atol=1e-5)
+
+
+def test_sharded_top_k_matches_unsharded():
+    """Слитый top-k по шардам совпадает с select_semantic и лексическим поиском без шардов"""
+    print("🔍 Шарды на localhost против нешардированного индекса...")
+    engine = build_engine()
+    index = engine.category_vectors
+    rng = np.random.default_rng(1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        router = start_router(engine, directory)
+        try:
+            for limit in (1, 3, N_CATEGORIES):
+                for threshold in (-1.0, 0.0, 0.2):
+                    query = rng.normal(size=32).astype(np.float32)
+                    query /= np.linalg.norm(query)
+                    assert_same(router.search_semantic(query, threshold, limit),
+                                select_semantic(index.score(query), threshold, None, limit))
+
+            for query in ("категория 5", "общий", "синоним 2", "нет такого"):
+                unsharded = merge_top([sorted(match_exact_and_synonyms(query, engine.lexical_entries),
+                                              key=rank_key)], 4)
+                assert_same(router.search_lexical(query, 4), unsharded)
+
+            assert router.stats()["partial_responses"] == 0
+
+            # Проверка при старте: свой каталог принимается, чужой или неполный - нет
+            router.verify(FINGERPRINT, N_CATEGORIES)
+            for fingerprint, n_categories in (("other-catalog", N_CATEGORIES), (FINGERPRINT, N_CATEGORIES + 1)):
+                try:
+                    router.verify(fingerprint, n_categories)
+                except RuntimeError as e:
+                    print(f"   ✅ Отклонено: {e}")
+                else:
+                    raise AssertionError(f"verify принял {fingerprint}/{n_categories}")
+        finally:
+            router.stop_local()
+    print("✅ Результаты совпадают")
+
+
+def test_silent_shard_does_not_block_others():
+    """Шард, который принимает соединение, но молчит, не занимает потоки роутера"""
+    print("\n🔍 Молчащий шард рядом со здоровым...")
+    engine = build_engine()
+
+    # Сокет слушает (ядро завершает TCP-рукопожатие), но никогда не отвечает
+    silent = socket.socket()
+    silent.bind(("127.0.0.1", 0))
+    silent.listen(128)
+
+    with tempfile.TemporaryDirectory() as directory:
+        prefixes = export_shards(engine, 1, directory)
+        healthy = ShardRouter([("127.0.0.1", BASE_PORT)], AUTHKEY, deadline=1.0)
+        healthy.start_local(prefixes, os.getpid())
+        router = ShardRouter([("127.0.0.1", BASE_PORT), silent.getsockname()], AUTHKEY,
+                             deadline=0.2, connections_per_shard=2)
+        try:
+            expected = sorted(match_exact_and_synonyms("общий", engine.lexical_entries), key=rank_key)[:3]
+            for _ in range(10):
+                start = time.monotonic()
+                results = router.search_lexical("общий", 3)
+                assert time.monotonic() - start < 0.5, "рассылка превысила дедлайн"
+                assert_same(results, expected)
+            stats = router.stats()
+            assert stats["shard_timeouts"] == [0, 10], stats
+        finally:
+            healthy.stop_local()
+            silent.close()
+    print("✅ Здоровый шард отвечает, молчащий учтен как таймаут")
+
+
+def test_shards_exit_with_parent():
+    """Локальные шарды завершаются вместе с процессом, указанным как родительский"""
+    print("\n🔍 Завершение шардов вместе с родительским процессом...")
+    engine = build_engine()
+    parent = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(60)"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        router = start_router(engine, directory, parent_pid=parent.pid)
+        try:
+            parent.kill()
+            parent.wait()
+            deadline = time.monotonic() + 10
+            while any(p.poll() is None for p in router._processes) and time.monotonic() < deadline:
+                time.sleep(0.1)
+            assert all(p.poll() is not None for p in router._processes), "шарды не завершились"
+        finally:
+            router.stop_local()
+    print("✅ Шарды завершились")
+
+
+def main():
+    test_sharded_top_k_matches_unsharded()
+    test_silent_shard_does_not_block_others()
+    test_shards_exit_with_parent()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Dict
+
+import serving
+from query_log import read_query_log
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_LIMIT = 10
+
+
+async def warm_up(engine, log_path: str = "search_logs.log", top_n: int = 500, batch_size: int = 64) -> Dict:
+    """Прогрев кэшей эмбеддингов и результатов по самым частым запросам из лога.
+
+    Эмбеддинги считаются батчами, затем для каждого запроса выполняется полный
+    поиск без логирования и учета в подсказках. Ошибка отдельного запроса
+    (например, перегрузка пула инференса) не останавливает прогрев и старт
+    сервера - она учитывается в отчете.
+    """
+    start = time.monotonic()
+
+    # limit из лога сохраняется как есть (None - все результаты, 0 - ноль): ключ кэша
+    # должен совпасть с ключом реального запроса. С порогом None семантический этап
+    # падает, такие записи прогреваются с порогом по умолчанию
+    counts = Counter(
+        (query, threshold if threshold is not None else DEFAULT_THRESHOLD, limit)
+        for query, threshold, limit in read_query_log(log_path, DEFAULT_THRESHOLD, DEFAULT_LIMIT)
+        if query.strip()
+    )
+    top = counts.most_common(top_n)
+    queries = list(dict.fromkeys(query for (query, _, _), _ in top))
+
+    # 1. Эмбеддинги батчами
+    loop = asyncio.get_running_loop()
+    for i in range(0, len(queries), batch_size):
+        batch = queries[i:i + batch_size]
+        vectors = await loop.run_in_executor(None, engine.model.encode, batch)
+        for query, vector in zip(batch, vectors):
+            engine.embedding_cache.put(query, vector)
+
+    # 2. Полные результаты (семантический этап берет эмбеддинги из кэша)
+    failed = 0
+    for (query, threshold, limit), _ in top:
+        try:
+            await engine.collect_results(query, threshold, limit)
+        except Exception as e:
+            failed += 1
+            logger.warning(f"Прогрев: запрос '{query}' не выполнен: {e}")
+
+    total_volume = sum(counts.values())
+    covered_volume = sum(count for _, count in top)
+    report = {
+        "duration_s": round(time.monotonic() - start, 3),
+        "queries_warmed": len(top) - failed,
+        "queries_failed": failed,
+        "unique_queries": len(counts),
+        "logged_searches": total_volume,
+        "coverage": round(covered_volume / total_volume, 4) if total_volume else 0.0,
+        "embeddings_cached": len(engine.embedding_cache),
+        "results_cached": len(engine.result_cache)
+    }
+    logger.info(
+        f"Прогрев завершен за {report['duration_s']:.3f}с: {report['queries_warmed']} запросов "
+        f"(ошибок: {failed}), "
+        f"покрытие {report['coverage']:.1%} исторического трафика"
+    )
+    return report
+
+
+async def warm_up_from_env(engine) -> Dict:
+    if serving.WARMUP_QUERIES <= 0:
+        return {"enabled": False}
+    report = await warm_up(engine, top_n=serving.WARMUP_QUERIES, batch_size=serving.WARMUP_BATCH_SIZE)
+    return {"enabled": True, **report}